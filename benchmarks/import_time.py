@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+# Cold start import cost of each entry point, measured with `python -X importtime` in a fresh
+# interpreter per run. Reports the total import time, the heaviest top level packages and
+# which of the heavy dependencies (kubernetes, boto3, botocore, yaml) each path ends up loading.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+HEAVY_MODULES = ('kubernetes', 'boto3', 'botocore', 'yaml', 'urllib3')
+
+# the lambda image has aws_utils installed next to index.py
+LAMBDA_PATH = os.pathsep.join([os.path.join(ROOT, 'infra', 'eks-manager'), os.path.join(ROOT, 'src')])
+
+# name -> (extra sys.path entries, code run after the imports are timed)
+ENTRY_POINTS = {
+    'aws_utils.eks_utils': (os.path.join(ROOT, 'src'), 'import aws_utils.eks_utils'),
+    'lambda index': (LAMBDA_PATH, 'import index'),
+    'lambda invalid event': (LAMBDA_PATH, 'import index; index.lambda_handler({}, None)'),
+    'eager kubernetes + boto3': (None, 'import kubernetes, boto3') # what every cold start paid before
+}
+
+
+def parse_importtime(stderr):
+    # lines look like "import time:  self [us] | cumulative | imported package"
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name[1:].rstrip(), int(self_us), int(cumulative_us))) # nested imports keep their indent
+    return modules
+
+def run_once(path, code):
+    probe = f"{code}\nimport sys; print(__import__('json').dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in (path, os.environ.get('PYTHONPATH')) if p))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe], check=True,
+                          capture_output=True, text=True, env=env)
+    modules = parse_importtime(proc.stderr)
+    loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    return modules, loaded
+
+def measure(name, path, code, repeats, top):
+    run_once(path, code) # warm up so .pyc compilation is not counted
+    totals = []
+    for _ in range(repeats):
+        modules, loaded = run_once(path, code)
+        totals.append(sum(self_us for _, self_us, _ in modules) / 1000)
+    top_level = sorted((m for m in modules if not m[0].startswith(' ')), key=lambda m: m[2], reverse=True)
+    return {
+        'entry_point': name,
+        'code': code,
+        'import_ms_median': round(statistics.median(totals), 2),
+        'import_ms_min': round(min(totals), 2),
+        'modules_imported': len(modules),
+        'heavy_modules_loaded': loaded,
+        'top_packages_ms': {m[0].strip(): round(m[2] / 1000, 2) for m in top_level[:top]}
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entry-points', nargs='+', default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS))
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help='heaviest top level packages to report')
+    parser.add_argument('--output', default=None, help='defaults to benchmarks/results/import_time-<timestamp>.json')
+    args = parser.parse_args()
+
+    results = []
+    for name in args.entry_points:
+        path, code = ENTRY_POINTS[name]
+        try:
+            result = measure(name, path, code, args.repeats, args.top)
+        except subprocess.CalledProcessError as e:
+            print(f"{name}: failed ({e.stderr.strip().splitlines()[-1]})", file=sys.stderr)
+            continue
+        print(f"{name:>26}: {result['import_ms_median']:>8} ms, {result['modules_imported']:>5} modules, "
+              f"loads {', '.join(result['heavy_modules_loaded']) or 'none of ' + '/'.join(HEAVY_MODULES)}", file=sys.stderr)
+        results.append(result)
+
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    output = args.output or os.path.join(RESULTS_DIR, f'import_time-{stamp}.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'timestamp': stamp, 'python': sys.version.split()[0], 'args': vars(args), 'results': results}, f, indent=4)
+    print(f'results written to {output}', file=sys.stderr)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import zlib
+from datetime import datetime, timezone
+
+from aws_utils import ip_utils
+from aws_utils.dns_utils import CachingResolver
+
+# Offline benchmark for config_query -> fmt_output_async -> search_for_ip/IPIndex.
+# AWS Config is replaced by FakeConfigClient and DNS by FakeDNSResolver so runs are
+# repeatable and need no credentials. Each inventory size runs in its own process
+# so peak RSS is per size. Results are written as JSON for comparing later changes.
+
+# share of each resource type in the synthetic inventory
+RESOURCE_MIX = {
+    'AWS::EC2::NetworkInterface': 0.60,
+    'AWS::EC2::EIP': 0.15,
+    'AWS::ElasticLoadBalancingV2::LoadBalancer': 0.12,
+    'AWS::RDS::DBInstance': 0.08,
+    'AWS::EKS::Cluster': 0.05
+}
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def fake_ip(n):
+    return f'52.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}'
+
+def make_record(resource_type, n, duplicate_hosts):
+    record = {
+        'accountId': f'{100000000000 + n % 400}',
+        'resourceId': f'res-{n:012d}',
+        'resourceName': None,
+        'resourceType': resource_type,
+        'awsRegion': 'us-east-1',
+        'availabilityZone': 'us-east-1a'
+    }
+    host_id = n % duplicate_hosts if duplicate_hosts else n
+    if resource_type == 'AWS::EC2::NetworkInterface':
+        record['configuration'] = {'association': {'publicIp': fake_ip(n)}}
+    elif resource_type == 'AWS::EC2::EIP':
+        record['configuration'] = {'publicIp': fake_ip(n), 'networkInterfaceId': f'eni-{n:012d}'}
+    elif resource_type == 'AWS::ElasticLoadBalancingV2::LoadBalancer':
+        record['configuration'] = {'dNSName': f'lb-{host_id}.elb.amazonaws.com'}
+    elif resource_type == 'AWS::RDS::DBInstance':
+        record['configuration'] = {'endpoint': {'address': f'db-{host_id}.rds.amazonaws.com'}}
+    else:
+        record['configuration'] = {
+            'Endpoint': f'https://{host_id}.gr7.us-east-1.eks.amazonaws.com',
+            'resourcesVpcConfig': {'endpointPublicAccess': True, 'endpointPrivateAccess': False}
+        }
+    return record
+
+
+class FakeConfigClient:
+    """
+    Stand in for the boto3 config client. Records are generated page by page so the
+    fixture itself does not hold the inventory in memory.
+    """
+
+    def __init__(self, size, page_size=100, latency=0.0, duplicate_hosts=0):
+        self.counts = {t: int(size * share) for t, share in RESOURCE_MIX.items()}
+        self.page_size = page_size
+        self.latency = latency
+        self.duplicate_hosts = duplicate_hosts
+        self.calls = 0
+
+    def select_aggregate_resource_config(self, Expression, ConfigurationAggregatorName, Limit=None, NextToken=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        resource_type = next(t for t in self.counts if t in Expression)
+        limit = Limit or self.page_size
+        start = int(NextToken or 0)
+        end = min(start + limit, self.counts[resource_type])
+        offset = list(self.counts).index(resource_type) * 10_000_000
+        results = [json.dumps(make_record(resource_type, offset + n, self.duplicate_hosts)) for n in range(start, end)]
+        response = {'Results': results}
+        if end < self.counts[resource_type]:
+            response['NextToken'] = str(end)
+        return response
+
+
+class FakeDNSResolver:
+    """
+    Stand in for aiodns.DNSResolver with a fixed latency per query.
+    """
+    queries = 0
+
+    def __init__(self, nameservers=None, latency=0.005):
+        self.latency = latency
+
+    async def query(self, hostname, qtype):
+        FakeDNSResolver.queries += 1
+        await asyncio.sleep(self.latency)
+        return [_Answer(fake_ip(zlib.crc32(hostname.encode()) & 0xFFFFFF), 300)]
+
+class _Answer:
+    def __init__(self, host, ttl):
+        self.host = host
+        self.ttl = ttl
+
+
+async def run_pipeline(args):
+    client = FakeConfigClient(args.size, args.page_size, args.config_latency, args.duplicate_hosts)
+    resolver = CachingResolver(
+        max_concurrency=args.dns_concurrency,
+        resolver_factory=lambda nameservers=None: FakeDNSResolver(nameservers, args.dns_latency)
+    )
+    timings = {}
+
+    start = time.perf_counter()
+    data = await ip_utils.async_config_query('benchmark', ip_utils.default_queries(), args.page_size,
+                                             max_workers=args.max_workers, client=client, resolver=resolver)
+    timings['query_and_format_s'] = time.perf_counter() - start
+
+    rng = random.Random(0)
+    search_ips = [d.get('publicIp') or d['resolvedIps'][0] for d in rng.sample(data, min(args.searches, len(data)))]
+
+    start = time.perf_counter()
+    for ip in search_ips[:args.linear_searches]:
+        ip_utils.search_for_ip(data, ip)
+    linear = time.perf_counter() - start
+    timings['search_for_ip_ms_per_ip'] = linear / max(1, min(args.linear_searches, len(search_ips))) * 1000
+
+    start = time.perf_counter()
+    index = ip_utils.IPIndex(data)
+    timings['index_build_s'] = time.perf_counter() - start
+    start = time.perf_counter()
+    index.lookup_many(search_ips)
+    timings['index_lookup_us_per_ip'] = (time.perf_counter() - start) / max(1, len(search_ips)) * 1e6
+
+    dns_hosts = sum(1 for d in data if 'fqdn' in d)
+    return {
+        'size': args.size,
+        'records_out': len(data),
+        'config_calls': client.calls,
+        'throughput_records_per_s': round(len(data) / timings['query_and_format_s'], 1),
+        'timings': {k: round(v, 4) for k, v in timings.items()},
+        'dns': {
+            'records_needing_dns': dns_hosts,
+            'queries_sent': FakeDNSResolver.queries,
+            'fan_out_ratio': round(FakeDNSResolver.queries / dns_hosts, 4) if dns_hosts else 0,
+            'resolver': resolver.stats()
+        },
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1) # KB on linux
+    }
+
+def run_sizes(args):
+    results = []
+    for size in args.sizes:
+        cmd = [sys.executable, os.path.abspath(__file__), '--single', '--size', str(size)] + passthrough_args(args)
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        result = json.loads(out)
+        print(f"{size:>9} resources: {result['throughput_records_per_s']:>10} rec/s, "
+              f"{result['peak_rss_mb']:>8} MB peak RSS, {result['dns']['queries_sent']} DNS queries", file=sys.stderr)
+        results.append(result)
+    return results
+
+def passthrough_args(args):
+    return [
+        '--page-size', str(args.page_size),
+        '--config-latency', str(args.config_latency),
+        '--dns-latency', str(args.dns_latency),
+        '--dns-concurrency', str(args.dns_concurrency),
+        '--duplicate-hosts', str(args.duplicate_hosts),
+        '--searches', str(args.searches),
+        '--linear-searches', str(args.linear_searches)
+    ] + (['--max-workers', str(args.max_workers)] if args.max_workers else [])
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {r['size']: r for r in json.load(f)['results']}
+    for r in results:
+        old = baseline.get(r['size'])
+        if old:
+            ratio = r['throughput_records_per_s'] / old['throughput_records_per_s']
+            print(f"{r['size']:>9} resources: throughput x{ratio:.2f}, "
+                  f"peak RSS {old['peak_rss_mb']} -> {r['peak_rss_mb']} MB", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--size', type=int, default=10_000)
+    parser.add_argument('--single', action='store_true', help='run one size in this process and print JSON')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--max-workers', type=int, default=None)
+    parser.add_argument('--config-latency', type=float, default=0.0, help='seconds per fake Config page')
+    parser.add_argument('--dns-latency', type=float, default=0.005, help='seconds per fake DNS query')
+    parser.add_argument('--dns-concurrency', type=int, default=50)
+    parser.add_argument('--duplicate-hosts', type=int, default=0, help='reuse this many hostnames per type (0 = all unique)')
+    parser.add_argument('--searches', type=int, default=1000)
+    parser.add_argument('--linear-searches', type=int, default=20)
+    parser.add_argument('--output', default=None, help='defaults to benchmarks/results/ip_pipeline-<timestamp>.json')
+    parser.add_argument('--baseline', default=None, help='previous results file to compare against')
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(asyncio.run(run_pipeline(args))))
+        return
+
+    results = run_sizes(args)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    output = args.output or os.path.join(RESULTS_DIR, f'ip_pipeline-{stamp}.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'timestamp': stamp, 'python': sys.version.split()[0], 'args': vars(args), 'results': results}, f, indent=4)
+    print(f'results written to {output}', file=sys.stderr)
+    if args.baseline:
+        compare(results, args.baseline)
+
+if __name__=="__main__":
+    main()
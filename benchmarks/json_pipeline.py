@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import json
+import time
+
+from aws_utils import ip_utils
+
+# Compares the per-record cost of the old public IP pipeline
+# (json.loads -> json.dumps -> json.loads) with the current one
+# (single parse with the fastest available backend, dicts passed straight through).
+# Only records that do not need DNS are used so the numbers are pure parse/format cost.
+
+
+def make_lines(count):
+    lines = []
+    for i in range(count):
+        record = {
+            'accountId': f'{100000000000 + i % 400}',
+            'resourceId': f'eni-{i:017x}',
+            'resourceName': None,
+            'resourceType': 'AWS::EC2::NetworkInterface',
+            'awsRegion': 'us-east-1',
+            'availabilityZone': 'us-east-1a',
+            'groups': [{'groupId': f'sg-{i:017x}', 'groupName': 'default'}],
+            'configuration': {'association': {'publicIp': f'52.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'}}
+        }
+        lines.append(json.dumps(record))
+    return lines
+
+async def old_pipeline(lines):
+    results = [json.loads(line) for line in lines]
+    formatted_results = [json.dumps(item) for item in results]
+    return await ip_utils.fmt_output_async(formatted_results)
+
+async def new_pipeline(lines):
+    results = [ip_utils.json_loads(line) for line in lines]
+    return await ip_utils.fmt_output_async(results)
+
+def bench(func, lines, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        asyncio.run(func(lines))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=100_000)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    lines = make_lines(args.records)
+    old = bench(old_pipeline, lines, args.rounds)
+    new = bench(new_pipeline, lines, args.rounds)
+    print(json.dumps({
+        'records': args.records,
+        'json_backend': ip_utils.json_loads.__module__,
+        'old_us_per_record': round(old / args.records * 1e6, 3),
+        'new_us_per_record': round(new / args.records * 1e6, 3),
+        'speedup': round(old / new, 2)
+    }, indent=4))
+
+if __name__=="__main__":
+    main()
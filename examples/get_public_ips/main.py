@@ -1,26 +1,42 @@
 import json
 import asyncio
-# from cost_utils.ip_utils import 
+from aws_utils.ip_utils import load_config, aiter_config_query, aiter_fmt_output, async_config_query, search_for_ip
+from aws_utils.snapshot_utils import refresh_inventory
+from aws_utils.stream_utils import iter_ndjson, search_file_for_ip, write_ndjson
 
 async def main():
     config = load_config()
-    data = await async_config_query(config.get('AGGREGATOR_NAME'), config.get('CONFIG_QUERIES'))
+    file = config.get('SAVE_FILE_NAME')
+    data = None
+    if config.get('SNAPSHOT_FILE'):
+        data, stats = await refresh_inventory(config.get('AGGREGATOR_NAME'), config.get('CONFIG_QUERIES'), config.get('SNAPSHOT_FILE'))
+        print(f"refreshed inventory: {json.dumps(stats)}")
+    elif config.get('SAVE_FILE'):
+        # stream records to disk as they are formatted instead of holding the whole inventory in memory.
+        # the writer fills a temp file and only replaces the previous file once the query succeeded
+        results = aiter_fmt_output(aiter_config_query(config.get('AGGREGATOR_NAME'), config.get('CONFIG_QUERIES')))
+        count = await write_ndjson(file, results)
+        print(f"wrote {count} records to {file}")
+    else:
+        data = await async_config_query(config.get('AGGREGATOR_NAME'), config.get('CONFIG_QUERIES'))
+
+    if data is not None and config.get('SAVE_FILE'):
+        await write_ndjson(file, data)
 
     if config.get('PRINT'):
-        pretty_print_data = json.dumps(data, indent=4)
-        print(pretty_print_data)
-    if config.get('SAVE_FILE'):
-        file = config.get('SAVE_FILE_NAME')
-        with open(file, 'w', encoding='utf-8') as f: # type: ignore
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        for record in (data if data is not None else iter_ndjson(file)):
+            print(json.dumps(record, indent=4))
     if config.get('SEARCH_IP'):
-        matches = search_for_ip(data, config.get('SEARCH_IP'))
+        if data is not None:
+            matches = search_for_ip(data, config.get('SEARCH_IP'))
+        else:
+            matches = list(search_file_for_ip(file, config.get('SEARCH_IP')))
         if matches:
-            print(f'match found for {config.get('SEARCH_IP')}')
+            print(f"match found for {config.get('SEARCH_IP')}")
             for match in matches:
                 print(json.dumps(match, indent=4))
         else:
-            print(f'no matches found for {config.get('SEARCH_IP')}')
+            print(f"no matches found for {config.get('SEARCH_IP')}")
 
 if __name__=="__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -1,12 +1,12 @@
 import json
-from aws_utils.ip_utils import get_accounts, fmt_total_cost_output
+from aws_utils.cost_utils import get_accounts, get_org_accounts, fmt_total_cost_output
 
 PARENT_ID=''
 
 def main():
-    accounts = get_accounts(PARENT_ID)
-    x, y = fmt_total_cost_output(accounts)
+    accounts = get_org_accounts() if not PARENT_ID else get_accounts(PARENT_ID) # whole org incl. nested OUs
+    x, y = fmt_total_cost_output(accounts, batched=True) # one Cost Explorer query for every account
 
-    print(json.dumps(x, indent=4))
+    print(json.dumps(x, indent=4, default=str)) # account dicts carry datetimes
 if __name__=="__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,132 +1,14 @@
 import json
-import boto3
 import logging
-import os
-import kubernetes
-import yaml
-import tempfile
-
-from typing import Dict, Any
-
-
-class EKSClusterManager:
-    def __init__(self, cluster_name: str, region: str, role_to_assume: str):
-        self.cluster_name = cluster_name
-        self.region = region
-        self.role_to_assume = role_to_assume
-        self.boto_session = self.create_boto_session()
-        self.eks_client = self.boto_session.client('eks')
-        self.cluster_desc = self.describe_cluster_config()
-
-    def assume_eks_role(self):
-        sts_client = boto3.client('sts', self.region)
-        assumed_role = sts_client.assume_role(
-            RoleArn=self.role_to_assume,
-            RoleSessionName=f"EksAssumeRole-{self.cluster_name}"
-        )
-        return assumed_role['Credentials']
-
-    def create_boto_session(self):
-        credentials = self.assume_eks_role()
-        return boto3.Session(
-            aws_access_key_id=credentials['AccessKeyId'],
-            aws_secret_access_key=credentials['SecretAccessKey'],
-            aws_session_token=credentials['SessionToken'],
-            region_name=self.region
-        )
-
-    def describe_cluster_config(self):
-        cluster_desc = self.eks_client.describe_cluster(name=self.cluster_name)['cluster']
-        return cluster_desc
-
-    def match_access_entries(self):
-        entries = self.eks_client.list_access_entries(clusterName=self.cluster_name)['accessEntries']
-        #simple match for now. TODO: add validation via describe_access_entry() method for 'kubernetesGroups', 'scope', etc
-        return any(entry in self.role_to_assume for entry in entries)
-
-    def update_access_entry(self):
-        if not self.match_access_entries():
-            # you have to create, update, then associate the access policy with EKS cluster
-            self.eks_client.create_access_entry(clusterName=self.cluster_name, principalArn=self.role_to_assume,kubernetesGroups=['masters'])
-            # response = client.list_access_policies() #may need to list and get admin policy before applying
-            # print(response)
-            # policy = client.associate_access_policy(
-            #                                             clusterName=cluster_name,
-            #                                             principalArn='arn:aws:iam::123456789012:role/your-role',
-            #                                             policyArn='arn:aws:eks::aws:cluster-access-policy/AmazonEKSAdminPolicy',
-            #                                             accessScope={
-            #                                                 'type': 'cluster'
-            #                                             }
-            #                                             )
-            # print(policy)
-            self.eks_client.update_access_entry(clusterName=self.cluster_name,principalArn=self.role_to_assume)
-            policy = self.eks_client.associate_access_policy(clusterName=self.cluster_name,
-                                                             principalArn=self.role_to_assume,
-                                                             policyArn='arn:aws:eks::aws:cluster-access-policy/AmazonEKSAdminPolicy',
-                                                            accessScope={'type': 'cluster'})
-
-            return policy['ResponseMetadata']['HTTPStatusCode'] #returns 200 if successful
-        return 304 #not modified http response code
-
-    def get_kube_config(self):
-        credentials = self.assume_eks_role()
-        resp = self.update_access_entry()
-        if resp in [200, 304]:
-            kubeconfig = {
-                'apiVersion': 'v1',
-                'kind': 'Config',
-                'clusters': [{
-                    'cluster': {
-                        'server': self.cluster_desc['endpoint'],
-                        'certificate-authority-data': self.cluster_desc['certificateAuthority']['data']
-                    },
-                    'name': self.cluster_name
-                }],
-                'contexts': [{
-                    'context': {
-                        'cluster': self.cluster_name,
-                        'user': 'aws',
-                    },
-                    'name': self.cluster_name
-                }],
-                'current-context': self.cluster_name,
-                'preferences': {},
-                'users': [{
-                    'name': 'aws',
-                    'user': {
-                        'exec': {
-                            'apiVersion': 'client.authentication.k8s.io/v1beta1',
-                            'command': 'aws',
-                            'args': [
-                                '--region',
-                                self.region,
-                                'eks',
-                                'get-token',
-                                '--cluster-name',
-                                self.cluster_name
-                            ],
-                            'env': [
-                                {
-                                    'name': 'AWS_ACCESS_KEY_ID',
-                                    'value': credentials['AccessKeyId']
-                                },
-                                {
-                                    'name': 'AWS_SECRET_ACCESS_KEY',
-                                    'value': credentials['SecretAccessKey']
-                                },
-                                {
-                                    'name': 'AWS_SESSION_TOKEN',
-                                    'value': credentials['SessionToken']
-                                }
-                            ]
-                        }
-                    }
-                }]
-            }
-            config_file = tempfile.NamedTemporaryFile(delete=False, mode='wb')
-            yaml.dump(kubeconfig, config_file, encoding='utf-8')
-            config_file.close()
-            return config_file.name
+import time
+
+from typing import Any, Dict
+
+# shared with the aws_utils package installed into the image (see Dockerfile). eks_utils imports
+# kubernetes, boto3 and botocore where they are first needed, so a cold start only pays for what
+# its code path uses (a rejected event never loads the kubernetes client)
+from aws_utils.eks_utils import POD_PAGE_SIZE, EKSClusterManager, iter_pod_pages
+
 
 def validate_input(event: Dict[str, Any]) -> tuple[str, str, str]:
     required_params = ['cluster_name', 'region', 'role_to_assume']
@@ -141,29 +23,132 @@ def validate_input(event: Dict[str, Any]) -> tuple[str, str, str]:
         event['role_to_assume']
     )
 
+# (cluster_name, region, role_to_assume) -> connection kept across warm invocations
+_CLUSTER_CACHE = {}
+AUTH_FAILURE_STATUSES = (401, 403)
+AUTH_FAILURE_CODES = ('ExpiredToken', 'ExpiredTokenException', 'AccessDenied', 'AccessDeniedException',
+                      'UnrecognizedClientException', 'InvalidClientTokenId')
+
+def get_cluster_connection(cluster_name: str, region: str, role_to_assume: str) -> tuple[Dict[str, Any], bool]:
+    """
+    Returns the cached connection for the cluster, or builds one (assume role, describe_cluster,
+    access entry check, in memory ApiClient) on the cold path.
+
+    Returns:
+        Tuple of (connection dict, True if it came from the cache)
+    """
+    key = (cluster_name, region, role_to_assume)
+    connection = _CLUSTER_CACHE.get(key)
+    if connection is not None:
+        return connection, True
+
+    eks = EKSClusterManager(
+        cluster_name=cluster_name,
+        region=region,
+        role_to_assume=role_to_assume
+    )
+    api_client = eks.get_api_client() # also runs the access entry check
+
+    connection = {
+        'manager': eks,
+        'cluster_desc': eks.cluster_desc,
+        'access_entry_checked': True,
+        'api_client': api_client
+    }
+    _CLUSTER_CACHE[key] = connection
+    return connection, False
+
+def invalidate_cluster_connection(cluster_name: str, region: str, role_to_assume: str):
+    connection = _CLUSTER_CACHE.pop((cluster_name, region, role_to_assume), None)
+    if connection is not None:
+        eks = connection['manager']
+        eks.credential_cache.invalidate(eks.role_to_assume, eks.session_name)
+        connection['api_client'].close()
+
+def is_auth_failure(error: Exception) -> bool:
+    import kubernetes
+    from botocore.exceptions import ClientError
+
+    if isinstance(error, kubernetes.client.exceptions.ApiException):
+        return error.status in AUTH_FAILURE_STATUSES
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code') in AUTH_FAILURE_CODES
+    return False
+
+def get_list_options(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Optional event parameters for the pod listing: namespace, page_size, metadata_only,
+    label_selector and field_selector.
+    """
+    options = {
+        'namespace': event.get('namespace', 'default'),
+        'page_size': event.get('page_size', POD_PAGE_SIZE),
+        'metadata_only': event.get('metadata_only', True),
+        'label_selector': event.get('label_selector'),
+        'field_selector': event.get('field_selector')
+    }
+    if not isinstance(options['page_size'], int) or options['page_size'] < 1:
+        raise ValueError(f"page_size must be a positive integer, got {options['page_size']!r}")
+    return options
+
+def emit_metrics(warm: bool, connect_ms: float, handler_ms: float):
+    # CloudWatch embedded metric format: printed lines become metrics split by Path (cold/warm)
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': 'EKSManager',
+                'Dimensions': [['Path']],
+                'Metrics': [
+                    {'Name': 'ConnectLatency', 'Unit': 'Milliseconds'},
+                    {'Name': 'HandlerLatency', 'Unit': 'Milliseconds'}
+                ]
+            }]
+        },
+        'Path': 'warm' if warm else 'cold',
+        'ConnectLatency': round(connect_ms, 2),
+        'HandlerLatency': round(handler_ms, 2)
+    }))
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     try:
+        start = time.perf_counter()
         cluster_name, region, role_to_assume = validate_input(event)
-        eks = EKSClusterManager(
-            cluster_name=cluster_name,
-            region=region,
-            role_to_assume=role_to_assume
-        )
-        kubeconfig = eks.get_kube_config()
-        kubernetes.config.load_kube_config(kubeconfig)
-        api = kubernetes.client.CoreV1Api()
-        pods = api.list_namespaced_pod(namespace='default')
-
-        os.remove(kubeconfig)
-
+        list_options = get_list_options(event)
+        list_pods = event.get('list_pods', False)
+        for attempt in range(2): # a cached connection whose auth fails is rebuilt once
+            connect_start = time.perf_counter()
+            connection, warm = get_cluster_connection(cluster_name, region, role_to_assume)
+            connect_ms = (time.perf_counter() - connect_start) * 1000
+            try:
+                pod_count, pod_names = 0, []
+                for items in iter_pod_pages(connection['api_client'], **list_options):
+                    pod_count += len(items)
+                    if list_pods:
+                        pod_names.extend(item['metadata']['name'] for item in items)
+                break
+            except Exception as e:
+                if not (warm and attempt == 0 and is_auth_failure(e)):
+                    raise
+                logging.warning(f"cached connection to {cluster_name} failed auth, reconnecting: {e}")
+                invalidate_cluster_connection(cluster_name, region, role_to_assume)
+        handler_ms = (time.perf_counter() - start) * 1000
+        emit_metrics(warm, connect_ms, handler_ms)
+
+        body = {
+            'message': 'Successfully connected to EKS cluster',
+            'pod_count': pod_count,
+            'namespace': list_options['namespace'],
+            'cluster_name': cluster_name,
+            'region': region,
+            'connection': 'warm' if warm else 'cold',
+            'connect_ms': round(connect_ms, 2)
+        }
+        if list_pods:
+            body['pods'] = pod_names
         return {
             'statusCode': 200,
-            'body': json.dumps({
-                'message': 'Successfully connected to EKS cluster',
-                'pod_count': len(pods.items),
-                'cluster_name': cluster_name,
-                'region': region
-            })
+            'body': json.dumps(body)
         }
 
     except ValueError as ve:
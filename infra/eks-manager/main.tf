@@ -88,6 +88,8 @@ resource "aws_iam_role_policy" "eks_access" {
           "eks:DescribeCluster",
           "eks:ListClusters",
           "eks:ListAccessEntries",
+          "eks:DescribeAccessEntry",
+          "eks:ListAssociatedAccessPolicies",
           "eks:CreateAccessEntry",
           "eks:UpdateAccessEntry",
           "eks:AssociateAccessPolicy"
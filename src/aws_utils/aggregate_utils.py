@@ -0,0 +1,165 @@
+from array import array
+from decimal import Decimal
+
+DIMENSIONS = ('account', 'service', 'period')
+
+
+class CostFrame:
+    """
+    Columnar view of get_costs() output. Each group row is loaded once into parallel
+    columns (account, service, period codes and the amount) so totals, group-bys, pivots
+    and threshold checks over every account run in a single pass without re-walking
+    ResultsByTime -> Groups.
+
+    Group Keys are read in get_cur_params() GroupBy order: LINKED_ACCOUNT, then SERVICE
+    when by_service is set.
+
+    Args:
+        exact: keep amounts as Decimal so totals match Cost Explorer to the cent instead of drifting with float rounding
+        metric: Cost Explorer metric to load
+    """
+
+    def __init__(self, exact=False, metric='UnblendedCost'):
+        self.exact = exact
+        self.metric = metric
+        self.labels = {dim: [] for dim in DIMENSIONS} # code -> label
+        self._codes = {dim: {} for dim in DIMENSIONS} # label -> code
+        self.columns = {dim: array('I') for dim in DIMENSIONS}
+        self.amounts = [] if exact else array('d')
+
+    @classmethod
+    def from_results(cls, results, exact=False, metric='UnblendedCost'):
+        frame = cls(exact=exact, metric=metric)
+        frame.extend(results)
+        return frame
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def _code(self, dim, label):
+        codes = self._codes[dim]
+        code = codes.get(label)
+        if code is None:
+            code = codes[label] = len(self.labels[dim])
+            self.labels[dim].append(label)
+        return code
+
+    def extend(self, results):
+        """
+        Loads ResultsByTime entries. Accepts any iterable, e.g. pages from a generator.
+        """
+        to_amount = Decimal if self.exact else float
+        accounts, services, periods = (self.columns[dim] for dim in DIMENSIONS)
+        for result in results:
+            period = self._code('period', result['TimePeriod']['Start'])
+            for group in result.get('Groups', []):
+                keys = group['Keys']
+                accounts.append(self._code('account', keys[0]))
+                services.append(self._code('service', keys[1] if len(keys) > 1 else ''))
+                periods.append(period)
+                self.amounts.append(to_amount(group['Metrics'][self.metric]['Amount']))
+        return self
+
+    def total(self):
+        return sum(self.amounts, Decimal(0) if self.exact else 0.0)
+
+    def group_by(self, *dims):
+        """
+        Args:
+            dims: one or more of 'account', 'service', 'period'
+
+        Returns:
+            Dict of label (tuple of labels for several dims) to summed amount
+        """
+        columns = [self.columns[dim] for dim in dims]
+        sums = {}
+        if len(columns) == 1:
+            for code, amount in zip(columns[0], self.amounts):
+                sums[code] = sums.get(code, 0) + amount
+            labels = self.labels[dims[0]]
+            return {labels[code]: amount for code, amount in sums.items()}
+        for row in zip(*columns, self.amounts):
+            key = row[:-1]
+            sums[key] = sums.get(key, 0) + row[-1]
+        labels = [self.labels[dim] for dim in dims]
+        return {tuple(l[c] for l, c in zip(labels, key)): amount for key, amount in sums.items()}
+
+    def pivot(self, rows='account', cols='service'):
+        """
+        Returns:
+            Nested dict of rows label -> cols label -> summed amount
+        """
+        output = {}
+        for (row, col), amount in self.group_by(rows, cols).items():
+            output.setdefault(row, {})[col] = amount
+        return output
+
+    def classify(self, threshold=1, dim='account'):
+        """
+        Splits labels by total, e.g. accounts that cost less than threshold (delete candidates)
+        and the rest (review), in one pass.
+
+        Returns:
+            Tuple of (dict of label -> total below threshold, dict of label -> total at or above)
+        """
+        below, above = {}, {}
+        for label, amount in self.group_by(dim).items():
+            (below if amount < threshold else above)[label] = amount
+        return below, above
+
+class CostAccumulator:
+    """
+    Streaming counterpart of CostFrame for long DAILY/HOURLY ranges. Only the running sums
+    per key are kept, so memory depends on the number of keys (e.g. accounts), not on how
+    many periods or pages are consumed.
+
+    Usage:
+        acc = CostAccumulator(dims=('account',))
+        for period, total in acc.stream(iter_costs(client, start, end)):
+            print(period, total) # totals update before the last page arrives
+
+    Args:
+        dims: dimensions to keep sums for, any of 'account', 'service', 'period'. Empty keeps only the total
+        exact: sum Decimal amounts instead of floats
+        metric: Cost Explorer metric to sum
+    """
+
+    def __init__(self, dims=('account',), exact=False, metric='UnblendedCost'):
+        self.dims = tuple(dims)
+        self.exact = exact
+        self.metric = metric
+        self.total = Decimal(0) if exact else 0.0
+        self.totals = {}
+        self.periods = 0
+
+    def add(self, result):
+        """
+        Adds one ResultsByTime entry.
+        """
+        to_amount = Decimal if self.exact else float
+        period = result['TimePeriod']['Start']
+        for group in result.get('Groups', []):
+            keys = group['Keys']
+            amount = to_amount(group['Metrics'][self.metric]['Amount'])
+            self.total += amount
+            if self.dims:
+                labels = {'account': keys[0], 'service': keys[1] if len(keys) > 1 else '', 'period': period}
+                key = labels[self.dims[0]] if len(self.dims) == 1 else tuple(labels[dim] for dim in self.dims)
+                self.totals[key] = self.totals.get(key, 0) + amount
+        self.periods += 1
+
+    def stream(self, results):
+        """
+        Consumes results lazily.
+
+        Yields:
+            Tuple of (period start, running total) after each ResultsByTime entry
+        """
+        for result in results:
+            self.add(result)
+            yield result['TimePeriod']['Start'], self.total
+
+    def consume(self, results):
+        for _ in self.stream(results):
+            pass
+        return self
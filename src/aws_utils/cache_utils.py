@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+# days Cost Explorer keeps revising a period after it ends, see is_closed()
+SETTLE_DAYS = 2
+
+
+def normalize_params(params):
+    """
+    Stable cache key material for get_cur_params() output. NextPageToken is dropped and
+    LINKED_ACCOUNT filter values are sorted so equivalent requests share an entry.
+    """
+    params = {k: v for k, v in params.items() if k != 'NextPageToken'}
+    dimensions = params.get('Filter', {}).get('Dimensions')
+    if dimensions:
+        params['Filter'] = {'Dimensions': dimensions | {'Values': sorted(dimensions['Values'])}}
+    return json.dumps(params, sort_keys=True, separators=(',', ':'))
+
+def cache_key(params):
+    return hashlib.sha256(normalize_params(params).encode('utf-8')).hexdigest()
+
+def parse_date(value):
+    return datetime.strptime(value[:10], '%Y-%m-%d').date()
+
+def first_of_next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def parse_timestamp(value):
+    # date or yyyy-MM-ddThh:mm:ssZ as a naive UTC datetime
+    if len(value) <= 10:
+        return datetime.strptime(value, '%Y-%m-%d')
+    return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+
+def format_timestamp(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def split_period(start_date, end_date, granularity='MONTHLY'):
+    """
+    Splits a Cost Explorer TimePeriod (End exclusive) into the periods Cost Explorer
+    returns for the granularity, e.g. calendar months for MONTHLY. HOURLY ranges are cached
+    a UTC day at a time, with the first and last periods cut at the requested times.
+
+    Returns:
+        List of (start, end) date strings, yyyy-MM-ddThh:mm:ssZ timestamps for HOURLY
+    """
+    if granularity == 'HOURLY':
+        return split_hourly_period(start_date, end_date)
+    start = parse_date(start_date)
+    end = parse_date(end_date)
+    output = []
+    while start < end:
+        if granularity == 'MONTHLY':
+            chunk_end = min(end, first_of_next_month(start))
+        else: # DAILY
+            chunk_end = start + timedelta(days=1)
+        output.append((start.isoformat(), chunk_end.isoformat()))
+        start = chunk_end
+    return output
+
+def split_hourly_period(start_date, end_date):
+    start = parse_timestamp(start_date)
+    end = parse_timestamp(end_date)
+    output = []
+    while start < end:
+        chunk_end = min(end, start.replace(hour=0, minute=0, second=0) + timedelta(days=1))
+        output.append((format_timestamp(start), format_timestamp(chunk_end)))
+        start = chunk_end
+    return output
+
+def is_closed(end_date, granularity='MONTHLY', today=None, settle_days=SETTLE_DAYS):
+    """
+    A period is closed (its costs no longer change) once its exclusive End is on or before
+    the start of the current month for MONTHLY, or today for DAILY/HOURLY. Cost Explorer
+    periods are UTC, and today is moved back settle_days since the latest days keep being revised.
+    """
+    today = (today or datetime.now(timezone.utc).date()) - timedelta(days=settle_days)
+    if granularity == 'HOURLY': # a period ending mid day is closed once that whole day is
+        end = (parse_timestamp(end_date) - timedelta(seconds=1)).date() + timedelta(days=1)
+    else:
+        end = parse_date(end_date)
+    if granularity == 'MONTHLY':
+        return end <= today.replace(day=1)
+    return end <= today
+
+
+class CostCache:
+    """
+    Cache for Cost Explorer ResultsByTime, keyed by the normalized get_cur_params() output.
+    An in-memory LRU sits in front of one JSON file per entry on disk. Entries for closed
+    periods never expire, entries for the still open period expire after open_ttl seconds.
+
+    Args:
+        cache_dir: directory for the on disk entries. None keeps the cache in memory only
+        open_ttl: seconds an entry for the current (open) period is reused
+        max_entries: size of the in-memory LRU
+    """
+
+    def __init__(self, cache_dir=os.path.join('~', '.cache', 'aws_utils', 'ce'), open_ttl=3600, max_entries=512):
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
+        self.open_ttl = open_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, params):
+        """
+        Returns:
+            Cached ResultsByTime list, or None on a miss or expired entry
+        """
+        key = cache_key(params)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        if entry is None and self.cache_dir and os.path.exists(self._path(key)):
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                entry = None
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is None or (entry['expiresAt'] is not None and entry['expiresAt'] < time.time()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['results']
+
+    def put(self, params, results, closed):
+        """
+        Args:
+            params: get_cur_params() output the results were fetched with
+            results: ResultsByTime list
+            closed: True if the period can never change, see is_closed()
+        """
+        key = cache_key(params)
+        entry = {
+            'params': json.loads(normalize_params(params)),
+            'results': results,
+            'expiresAt': None if closed else time.time() + self.open_ttl
+        }
+        self._remember(key, entry)
+        if self.cache_dir:
+            tmp_path = f'{self._path(key)}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'memoryEntries': len(self._memory)}
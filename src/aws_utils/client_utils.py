@@ -0,0 +1,141 @@
+import threading
+
+DEFAULT_MAX_POOL_CONNECTIONS = 50 # botocore's default of 10 is below most of our thread pool sizes
+# clients used behind a throttle_utils.RequestScheduler make one attempt per call. botocore's own
+# throttle retries would hide throttles from the scheduler's backoff and multiply its attempts
+SCHEDULED_RETRIES = {'total_max_attempts': 1}
+
+
+def credentials_identity(session=None):
+    """
+    Returns:
+        Hashable identity of the credentials a session signs with. Clients built from the same
+        identity are interchangeable. Refreshable credentials are identified by object, since
+        their keys rotate while every client built on them keeps working.
+    """
+    if session is None:
+        return None # boto3's default session and credential chain
+    credentials = session.get_credentials()
+    if credentials is None:
+        return None
+    if hasattr(credentials, 'refresh_needed'): # RefreshableCredentials and its deferred variant
+        return ('refreshable', id(credentials))
+    return ('static', credentials.access_key)
+
+
+class ClientPool:
+    """
+    Thread safe cache of boto3 clients keyed by (service, region, credentials identity).
+
+    Creating a client loads and parses the service model, so every module asks the pool
+    instead of calling boto3.client() per request. Each client keeps its own urllib3
+    connection pool of max_pool_connections, so reusing the client also reuses its
+    keep-alive connections. boto3 clients are thread safe once built, creation is not,
+    so clients are built under the pool's lock.
+    """
+
+    def __init__(self, max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS, config=None):
+        self.max_pool_connections = max_pool_connections
+        self.config = config # optional botocore.config.Config merged into every client's config
+        self.hits = 0
+        self.misses = 0
+        self._clients = {} # (service, region, identity, max_pool_connections, retries, request_timeout) -> boto3 client
+        self._sessions = {} # identity -> session, keeps id() based identities alive
+        self._client_hooks = [] # called with every client, e.g. metrics_utils.instrument_client
+        self._lock = threading.Lock()
+
+    def client(self, service, region=None, session=None, max_pool_connections=None, retries=None, request_timeout=None):
+        """
+        Args:
+            service: boto3 service name, e.g. 'config'
+            region: region name, boto3's default region if not set
+            session: Optional boto3.Session to build the client from (e.g. assumed role credentials)
+            max_pool_connections: Optional per client override of the pool's max_pool_connections
+            retries: Optional botocore retries config, e.g. SCHEDULED_RETRIES
+            request_timeout: Optional (connect, read) timeouts in seconds, botocore's 60s defaults if not set
+
+        Returns:
+            Shared boto3 client
+        """
+        max_pool_connections = max_pool_connections or self.max_pool_connections
+        identity = credentials_identity(session)
+        key = (service, region, identity, max_pool_connections, tuple(sorted((retries or {}).items())), request_timeout)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.hits += 1
+                return client
+            self.misses += 1
+            import boto3
+            from botocore.config import Config
+
+            config = Config(max_pool_connections=max_pool_connections)
+            if retries:
+                config = config.merge(Config(retries=dict(retries))) # botocore fills in the dict it is given
+            if request_timeout:
+                config = config.merge(Config(connect_timeout=request_timeout[0], read_timeout=request_timeout[1]))
+            if self.config is not None:
+                config = config.merge(self.config)
+            client = (session or boto3).client(service, region_name=region, config=config)
+            for hook in self._client_hooks:
+                hook(client)
+            self._clients[key] = client
+            if identity is not None:
+                self._sessions[identity] = session
+            return client
+
+    def add_client_hook(self, hook):
+        """
+        Calls hook(client) on every pooled client, now and whenever a new one is built.
+        """
+        with self._lock:
+            if hook in self._client_hooks:
+                return
+            self._client_hooks.append(hook)
+            for client in self._clients.values():
+                hook(client)
+
+    def evict(self, session=None):
+        """
+        Drops every client built from the session's credentials, e.g. after they were revoked.
+        """
+        identity = credentials_identity(session)
+        with self._lock:
+            for key in [k for k in self._clients if k[2] == identity]:
+                del self._clients[key]
+            self._sessions.pop(identity, None)
+
+    def stats(self):
+        with self._lock:
+            return {'clients': len(self._clients), 'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._sessions.clear()
+
+
+_default_client_pool = None
+_default_client_pool_lock = threading.Lock()
+
+def get_default_client_pool():
+    """
+    Returns:
+        Process wide ClientPool shared by ip_utils, cost_utils and eks_utils
+    """
+    global _default_client_pool
+    with _default_client_pool_lock:
+        if _default_client_pool is None:
+            _default_client_pool = ClientPool()
+        return _default_client_pool
+
+def retries_for(scheduler):
+    return SCHEDULED_RETRIES if scheduler is not None else None
+
+def get_client(service, region=None, session=None, max_pool_connections=None, scheduler=None):
+    """
+    Returns:
+        Shared client from the default pool, making single attempts if a scheduler will drive its retries
+    """
+    return get_default_client_pool().client(service, region, session=session, max_pool_connections=max_pool_connections,
+                                            retries=retries_for(scheduler))
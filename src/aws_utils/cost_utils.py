@@ -1,17 +1,76 @@
-import boto3
+import time
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from aws_utils.cache_utils import is_closed, split_period
+from aws_utils.client_utils import get_client
+from aws_utils.metrics_utils import timed
+from aws_utils.throttle_utils import scheduled_call
 
 
 AWS_REGION= 'us-east-1'
 
-def get_accounts(ParentId):
+def list_all(scheduler, service, method, result_key, **params):
+    # follows NextToken by hand so each page can go through the scheduler
+    output = []
+    while True:
+        page = scheduled_call(scheduler, service, method, **params)
+        output.extend(page[result_key])
+        if not page.get('NextToken'):
+            return output
+        params['NextToken'] = page['NextToken']
+
+def get_accounts(ParentId, scheduler=None):
     output =[]
     try:
-        client = boto3.client('organizations', region_name=AWS_REGION)
-        paginator = client.get_paginator('list_accounts_for_parent')
-        for page in paginator.paginate(ParentId=ParentId):
-            output.extend(page['Accounts'])
+        client = get_client('organizations', AWS_REGION, scheduler=scheduler)
+        output = list_all(scheduler, 'organizations', client.list_accounts_for_parent, 'Accounts', ParentId=ParentId)
+    except ClientError as e:
+        print(e)
+    except Exception as e:
+        print(e)
+    return output
+
+# root id (None for the org's own root) -> (expires_at, accounts) for get_org_accounts()
+_ORG_TREE_CACHE = {}
+
+def get_org_accounts(root_id=None, max_workers=8, cache_ttl=3600, scheduler=None):
+    # walks the whole org tree from the root, expanding every OU on the same level concurrently.
+    # accounts are returned flat with 'OuPath' (e.g. 'Root/Workloads/Prod') and 'ParentId' added.
+    # the result is cached per root for cache_ttl seconds since the tree rarely changes
+    output = []
+    cache_key = root_id
+    cached = _ORG_TREE_CACHE.get(cache_key)
+    if cached and cached[0] > time.monotonic():
+        return list(cached[1])
+    try:
+        client = get_client('organizations', AWS_REGION, scheduler=scheduler)
+        if root_id is None:
+            roots = list_all(scheduler, 'organizations', client.list_roots, 'Roots')
+            root_id, root_name = roots[0]['Id'], roots[0]['Name']
+        else:
+            root_name = 'Root'
+
+        def expand(node):
+            parent_id, path = node
+            accounts = list_all(scheduler, 'organizations', client.list_accounts_for_parent, 'Accounts', ParentId=parent_id)
+            ous = list_all(scheduler, 'organizations', client.list_organizational_units_for_parent,
+                           'OrganizationalUnits', ParentId=parent_id)
+            return (
+                [account | {'OuPath': path, 'ParentId': parent_id} for account in accounts],
+                [(ou['Id'], f"{path}/{ou['Name']}") for ou in ous]
+            )
+
+        level = [(root_id, root_name)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while level:
+                next_level = []
+                for accounts, ous in executor.map(expand, level):
+                    output.extend(accounts)
+                    next_level.extend(ous)
+                level = next_level
+        _ORG_TREE_CACHE[cache_key] = (time.monotonic() + cache_ttl, output)
+        output = list(output)
     except ClientError as e:
         print(e)
     except Exception as e:
@@ -21,7 +80,8 @@ def get_accounts(ParentId):
 def get_cur_params(start_date,
                    end_date,
                    account_id=None,
-                   by_service=False):
+                   by_service=False,
+                   granularity='MONTHLY'):
     #https://docs.aws.amazon.com/aws-cost-management/latest/APIReference/API_GetDimensionValues.html
     group_by = [
             {'Type': 'DIMENSION', 'Key': 'LINKED_ACCOUNT'}
@@ -33,7 +93,7 @@ def get_cur_params(start_date,
             'Start': start_date,
             'End': end_date
         },
-        'Granularity': 'MONTHLY',
+        'Granularity': granularity,
         'Metrics': ['UnblendedCost'],
         'GroupBy': group_by
     }
@@ -41,34 +101,133 @@ def get_cur_params(start_date,
         params['Filter'] = {
             'Dimensions': {
                 'Key': 'LINKED_ACCOUNT',
-                'Values': [account_id]
+                'Values': account_id if isinstance(account_id, list) else [account_id]
             }
         }
 
     return params
 
+@timed('get_costs')
 def get_costs(client,
               start_date,
               end_date,
               account_id=None,
-              by_service=False):
+              by_service=False,
+              scheduler=None,
+              granularity='MONTHLY',
+              cache=None):
+
+    if cache is not None:
+        return get_costs_cached(client, start_date, end_date, cache, account_id=account_id,
+                                by_service=by_service, scheduler=scheduler, granularity=granularity)
+
+    return list(iter_costs(client, start_date, end_date, account_id=account_id,
+                           by_service=by_service, scheduler=scheduler, granularity=granularity))
 
+def iter_costs(client,
+               start_date,
+               end_date,
+               account_id=None,
+               by_service=False,
+               scheduler=None,
+               granularity='MONTHLY'):
+    # generator version of get_costs(): yields each ResultsByTime entry as soon as its page arrives,
+    # so DAILY/HOURLY ranges can be fed to get_total() or aggregate_utils.CostAccumulator in constant memory
     params = get_cur_params(start_date=start_date,
                                             end_date=end_date,
                                             account_id=account_id,
-                                            by_service=by_service)
+                                            by_service=by_service,
+                                            granularity=granularity)
 
-    cost_data = []
     next_token = None
     while True:
         if next_token:
             params['NextPageToken'] = next_token
-        response = client.get_cost_and_usage(**params)
-        cost_data.extend(response['ResultsByTime'])
+        response = scheduled_call(scheduler, 'ce', client.get_cost_and_usage, **params)
+        yield from response['ResultsByTime']
         next_token = response.get('NextPageToken')
         if not next_token:
             break
-    return cost_data
+
+def get_costs_cached(client,
+                     start_date,
+                     end_date,
+                     cache,
+                     account_id=None,
+                     by_service=False,
+                     scheduler=None,
+                     granularity='MONTHLY'):
+    # splits the range into Cost Explorer periods, serves what it can from cache_utils.CostCache
+    # and fetches each run of uncached periods with one iter_costs() query. not get_costs(), so the
+    # get_costs stage timer only measures the outer call
+    periods = split_period(start_date, end_date, granularity)
+
+    def period_params(start, end):
+        return get_cur_params(start, end, account_id=account_id, by_service=by_service, granularity=granularity)
+
+    cached = {period: cache.get(period_params(*period)) for period in periods}
+    missing_runs = []
+    for period in periods:
+        if cached[period] is not None:
+            continue
+        if missing_runs and missing_runs[-1][-1][1] == period[0]:
+            missing_runs[-1].append(period)
+        else:
+            missing_runs.append([period])
+
+    for run in missing_runs:
+        fetched = list(iter_costs(client, run[0][0], run[-1][1], account_id=account_id,
+                                  by_service=by_service, scheduler=scheduler, granularity=granularity))
+        for start, end in run:
+            width = None if granularity == 'HOURLY' else 10 # HOURLY periods can start and end mid day
+            results = [r for r in fetched if start[:width] <= r['TimePeriod']['Start'][:width] < end[:width]]
+            cache.put(period_params(start, end), results, closed=is_closed(end, granularity))
+            cached[(start, end)] = results
+
+    return [result for period in periods for result in cached[period]]
+
+def split_costs_by_account(cost_data, account_ids):
+    # splits get_costs() output grouped by LINKED_ACCOUNT into the same shape a
+    # single account query returns, so get_total() gives identical totals
+    output = {account_id: [] for account_id in account_ids}
+    for result in cost_data:
+        groups_by_account = {account_id: [] for account_id in account_ids}
+        for group in result.get('Groups', []):
+            account_groups = groups_by_account.get(group['Keys'][0])
+            if account_groups is not None:
+                account_groups.append(group)
+        for account_id, groups in groups_by_account.items():
+            output[account_id].append(result | {'Groups': groups})
+    return output
+
+def get_costs_batched(client,
+                      start_date,
+                      end_date,
+                      account_ids,
+                      by_service=False,
+                      chunk_size=None,
+                      scheduler=None,
+                      cache=None):
+    # one paginated query for every linked account (or one per chunk_size accounts
+    # with a LINKED_ACCOUNT Values filter) instead of one query per account
+    if not chunk_size:
+        cost_data = get_costs(client, start_date, end_date, by_service=by_service, scheduler=scheduler, cache=cache)
+        return split_costs_by_account(cost_data, account_ids)
+
+    def get_chunk(chunk):
+        cost_data = get_costs(client, start_date, end_date, account_id=chunk, by_service=by_service,
+                              scheduler=scheduler, cache=cache)
+        return split_costs_by_account(cost_data, chunk)
+
+    chunks = [account_ids[i:i + chunk_size] for i in range(0, len(account_ids), chunk_size)]
+    output = {}
+    for chunk_costs in (scheduler.map(get_chunk, chunks) if scheduler else map(get_chunk, chunks)):
+        output.update(chunk_costs)
+    return output
+
+def account_id_of(account):
+    # get_accounts() returns account dicts, callers may also pass plain ids
+    return account['Id'] if isinstance(account, dict) else account
 
 def get_total(totals_list):
     output = 0.0
@@ -82,17 +241,34 @@ def get_total(totals_list):
             print('key not found')
     return output
 
-def fmt_total_cost_output(accounts_list,by_service=False):
+def fmt_total_cost_output(accounts_list,by_service=False,batched=False,chunk_size=None,scheduler=None,cache=None):
     delete_output =dict()
     review_output = dict()
     start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
     end_date = datetime.now().strftime('%Y-%m-%d')
     
     try:
-        client = boto3.client('ce', region_name=AWS_REGION)
+        client = get_client('ce', AWS_REGION, scheduler=scheduler)
+        if batched:
+            account_ids = [account_id_of(account) for account in accounts_list]
+            batched_costs = get_costs_batched(client, start_date, end_date, account_ids,
+                                              by_service=by_service, chunk_size=chunk_size, scheduler=scheduler,
+                                              cache=cache)
+        elif scheduler:
+            # per account queries run concurrently, rate limited by the scheduler
+            responses = scheduler.map(
+                lambda account: get_costs(client, start_date, end_date, account_id=account,
+                                          by_service=by_service, scheduler=scheduler, cache=cache),
+                accounts_list
+            )
 
-        for account in accounts_list:
-            response =    get_costs(client, start_date, end_date, account_id=account, by_service=by_service)
+        for i, account in enumerate(accounts_list):
+            if batched:
+                response = batched_costs[account_id_of(account)]
+            elif scheduler:
+                response = responses[i]
+            else:
+                response =    get_costs(client, start_date, end_date, account_id=account, by_service=by_service, cache=cache)
             # print(response)
             total_cost = get_total(response)
             if total_cost < 1:
@@ -0,0 +1,142 @@
+import asyncio
+import time
+import aiodns
+
+# answers that mean the name really has no A record and are safe to cache
+NEGATIVE_ERRORS = (aiodns.error.ARES_ENOTFOUND, aiodns.error.ARES_ENODATA)
+
+
+class CachingResolver:
+    """
+    Shared DNS resolver for A record lookups.
+
+    Reuses one aiodns channel per event loop, merges concurrent lookups of the same
+    hostname into one query, caches answers by record TTL (negative answers for
+    negative_ttl seconds) and caps in-flight queries with a semaphore.
+    The cache outlives the event loop so re-runs in the same process skip
+    names that were already resolved.
+    """
+
+    def __init__(self, max_concurrency=50, negative_ttl=60, min_ttl=5, max_ttl=3600, nameservers=None,
+                 resolver_factory=None):
+        self.max_concurrency = max_concurrency
+        self.negative_ttl = negative_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.nameservers = nameservers
+        self.resolver_factory = resolver_factory or aiodns.DNSResolver # swap for a fake resolver in benchmarks
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.errors = 0
+        self._cache = {} # hostname -> (expires_at, ips)
+        self._inflight = {} # hostname -> future shared by concurrent callers
+        self._loop = None
+        self._resolver = None
+        self._semaphore = None
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop: # aiodns channels and semaphores are tied to a loop
+            self._loop = loop
+            self._resolver = self.resolver_factory(nameservers=self.nameservers)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._inflight = {}
+
+    def _cached(self, hostname):
+        entry = self._cache.get(hostname)
+        if entry is None:
+            return None
+        expires_at, ips = entry
+        if expires_at < time.monotonic():
+            del self._cache[hostname]
+            return None
+        return ips
+
+    async def resolve(self, hostname: str):
+        """
+        Resolves a FQDN to IPv4 addresses.
+
+        Args:
+            hostname: FQDN string
+
+        Returns:
+            List of resolved IP addresses. Empty if the name does not resolve
+        """
+        ips = self._cached(hostname)
+        if ips is not None:
+            self.hits += 1
+            if not ips:
+                self.negative_hits += 1
+            return list(ips)
+
+        self._bind_loop()
+        future = self._inflight.get(hostname)
+        if future is not None: # another task is already resolving this name
+            self.hits += 1
+            return list(await asyncio.shield(future))
+
+        self.misses += 1
+        future = self._loop.create_future()
+        self._inflight[hostname] = future
+        try:
+            ips = await self._query(hostname)
+            future.set_result(ips)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self.errors += 1 # counted once even when concurrent callers share the failed lookup
+            future.set_exception(e)
+            future.exception() # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            self._inflight.pop(hostname, None)
+        return list(ips)
+
+    async def _query(self, hostname):
+        async with self._semaphore:
+            try:
+                results = await self._resolver.query(hostname, 'A') #Just A records for now
+            except aiodns.error.DNSError as e:
+                code = e.args[0] if e.args else None
+                if code in NEGATIVE_ERRORS:
+                    self._cache[hostname] = (time.monotonic() + self.negative_ttl, ())
+                else:
+                    self.errors += 1 # transient failures (timeouts, SERVFAIL) are not cached
+                return []
+        ips = sorted({r.host for r in results})
+        ttl = min((r.ttl for r in results), default=self.min_ttl)
+        ttl = max(self.min_ttl, min(ttl, self.max_ttl))
+        self._cache[hostname] = (time.monotonic() + ttl, tuple(ips))
+        return ips
+
+    def stats(self):
+        """
+        Returns:
+            Dict of cache hit/miss counters and current cache size
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'negativeHits': self.negative_hits,
+            'errors': self.errors,
+            'cached': len(self._cache),
+            'maxConcurrency': self.max_concurrency
+        }
+
+    def clear(self):
+        self._cache.clear()
+
+
+_default_resolver = None
+
+def get_default_resolver():
+    """
+    Returns:
+        Process wide CachingResolver used by resolve_dns_async() when no resolver is passed
+    """
+    global _default_resolver
+    if _default_resolver is None:
+        _default_resolver = CachingResolver()
+    return _default_resolver
@@ -1,73 +1,396 @@
 from urllib import response
-import boto3
-import kubernetes
-import yaml
+import base64
+import json
 import tempfile
-import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from aws_utils.client_utils import get_default_client_pool, retries_for
+from aws_utils.metrics_utils import stage_timer, timed
+from aws_utils.throttle_utils import scheduled_call
 
+# boto3, botocore, kubernetes and yaml are imported inside the methods that use them so importing
+# this module (or a path that never reaches the cluster) does not pay for them
+
+
+class CredentialCache:
+    """
+    Caches assumed role credentials per (role ARN, session name) until expiry_margin seconds
+    before they expire. Once inside refresh_margin a background thread assumes the role again
+    while the current credentials keep being served. The boto3 session built on the credentials
+    is cached too and uses RefreshableCredentials, so it and its clients (kept in a
+    client_utils.ClientPool) pick up refreshed credentials without being rebuilt.
+    """
+
+    def __init__(self, refresh_margin=900, expiry_margin=300, duration_seconds=None, scheduler=None,
+                 client_pool=None):
+        self.refresh_margin = refresh_margin
+        self.expiry_margin = expiry_margin
+        self.duration_seconds = duration_seconds
+        self.scheduler = scheduler
+        self.client_pool = client_pool or get_default_client_pool()
+        self.assume_calls = 0
+        self._entries = {} # (role_arn, session_name) -> sts Credentials
+        self._refreshing = set()
+        self._sessions = {} # (role_arn, session_name, region) -> boto3.Session
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _sts_client(self, region):
+        return self.client_pool.client('sts', region, retries=retries_for(self.scheduler))
+
+    def _assume(self, role_arn, session_name, region):
+        params = {'RoleArn': role_arn, 'RoleSessionName': session_name}
+        if self.duration_seconds:
+            params['DurationSeconds'] = self.duration_seconds
+        credentials = scheduled_call(self.scheduler, 'sts', self._sts_client(region).assume_role, **params)['Credentials']
+        with self._lock:
+            self.assume_calls += 1
+            self._entries[(role_arn, session_name)] = credentials
+        return credentials
+
+    def _refresh_in_background(self, role_arn, session_name, region):
+        key = (role_arn, session_name)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._assume(role_arn, session_name, region)
+            except Exception as e:
+                print(f"background credential refresh for {role_arn} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _remaining(self, credentials):
+        return (credentials['Expiration'] - datetime.now(timezone.utc)).total_seconds()
+
+    def credentials(self, role_arn, session_name, region):
+        """
+        Returns:
+            sts assume_role Credentials dict for the role, assuming it only when needed
+        """
+        key = (role_arn, session_name)
+        with self._lock:
+            credentials = self._entries.get(key)
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        if credentials is not None:
+            remaining = self._remaining(credentials)
+            if remaining > self.expiry_margin:
+                if remaining <= self.refresh_margin:
+                    self._refresh_in_background(role_arn, session_name, region)
+                return credentials
+        with key_lock: # only one caller assumes the role, the rest reuse its result
+            with self._lock:
+                credentials = self._entries.get(key)
+            if credentials is not None and self._remaining(credentials) > self.expiry_margin:
+                return credentials
+            return self._assume(role_arn, session_name, region)
+
+    def session(self, role_arn, session_name, region):
+        """
+        Returns:
+            boto3.Session for the assumed role, shared by every caller using the same role
+        """
+        key = (role_arn, session_name, region)
+        with self._lock:
+            session = self._sessions.get(key)
+        if session is not None:
+            return session
+
+        def refresh_using():
+            credentials = self.credentials(role_arn, session_name, region)
+            return {
+                'access_key': credentials['AccessKeyId'],
+                'secret_key': credentials['SecretAccessKey'],
+                'token': credentials['SessionToken'],
+                'expiry_time': credentials['Expiration'].isoformat()
+            }
+
+        import boto3
+        import botocore.session
+        from botocore.credentials import RefreshableCredentials
+
+        refreshable = RefreshableCredentials.create_from_metadata(
+            metadata=refresh_using(),
+            refresh_using=refresh_using,
+            method='sts-assume-role',
+            advisory_timeout=self.refresh_margin,
+            mandatory_timeout=self.expiry_margin
+        )
+        botocore_session = botocore.session.get_session()
+        botocore_session._credentials = refreshable
+        session = boto3.Session(botocore_session=botocore_session, region_name=region)
+        with self._lock:
+            return self._sessions.setdefault(key, session)
+
+    def invalidate(self, role_arn, session_name):
+        """
+        Drops the credentials, sessions and clients of a role, e.g. after an auth failure.
+        """
+        with self._lock:
+            self._entries.pop((role_arn, session_name), None)
+            sessions = [self._sessions.pop(k) for k in list(self._sessions) if k[:2] == (role_arn, session_name)]
+        for session in sessions:
+            self.client_pool.evict(session)
+
+    def client(self, role_arn, session_name, region, service, scheduler=None, request_timeout=None):
+        """
+        Args:
+            scheduler: set when a throttle_utils.RequestScheduler drives the client's retries
+            request_timeout: Optional (connect, read) timeouts in seconds for the client's requests
+
+        Returns:
+            Cached boto3 client for the assumed role
+        """
+        return self.client_pool.client(service, region, session=self.session(role_arn, session_name, region),
+                                       retries=retries_for(scheduler), request_timeout=request_timeout)
+
+
+_default_credential_cache = None
+
+def get_default_credential_cache():
+    """
+    Returns:
+        Process wide CredentialCache used by EKSClusterManager when none is passed
+    """
+    global _default_credential_cache
+    if _default_credential_cache is None:
+        _default_credential_cache = CredentialCache()
+    return _default_credential_cache
+
+
+# https://github.com/kubernetes-sigs/aws-iam-authenticator#api-authorization-from-outside-a-cluster
+TOKEN_PREFIX = 'k8s-aws-v1.'
+TOKEN_PRESIGN_EXPIRES = 60 # X-Amz-Expires of the presigned url
+TOKEN_LIFETIME = 900 # EKS accepts a token for 15 minutes after it is signed
+
+
+class EKSTokenProvider:
+    """
+    Generates EKS bearer tokens in process, the same way `aws eks get-token` does: a presigned
+    STS GetCallerIdentity url carrying the cluster name in the x-k8s-aws-id header. Tokens are
+    cached until refresh_margin seconds before they expire.
+
+    Args:
+        cluster_name: EKS cluster name
+        region: cluster region, used for the regional STS endpoint
+        session: boto3.Session holding the credentials to sign with (e.g. CredentialCache.session())
+        sts_client: Optional sts client of that session, only used for its service model
+    """
+
+    def __init__(self, cluster_name, region, session, sts_client=None, refresh_margin=60):
+        self.cluster_name = cluster_name
+        self.region = region
+        self.session = session
+        self.refresh_margin = refresh_margin
+        self._sts_client = sts_client
+        self._token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def _generate(self):
+        from botocore.signers import RequestSigner
+
+        sts_client = self._sts_client or self.session.client('sts', region_name=self.region)
+        signer = RequestSigner(
+            sts_client.meta.service_model.service_id,
+            self.region,
+            'sts',
+            'v4',
+            self.session.get_credentials(),
+            self.session.events
+        )
+        params = {
+            'method': 'GET',
+            'url': f'https://sts.{self.region}.amazonaws.com/?Action=GetCallerIdentity&Version=2011-06-15',
+            'body': {},
+            'headers': {'x-k8s-aws-id': self.cluster_name},
+            'context': {}
+        }
+        url = signer.generate_presigned_url(params, region_name=self.region,
+                                            expires_in=TOKEN_PRESIGN_EXPIRES, operation_name='')
+        return TOKEN_PREFIX + base64.urlsafe_b64encode(url.encode('utf-8')).decode('utf-8').rstrip('=')
+
+    def get_token(self):
+        """
+        Returns:
+            Bearer token for the cluster, reused until shortly before it expires
+        """
+        with self._lock:
+            if self._token is None or time.monotonic() >= self._expires_at:
+                signed_at = time.monotonic()
+                self._token = self._generate()
+                self._expires_at = signed_at + TOKEN_LIFETIME - self.refresh_margin
+            return self._token
+
+    def configure(self, configuration):
+        """
+        Sets the bearer token on a kubernetes.client.Configuration and refreshes it before every
+        request via refresh_api_key_hook, so long lived clients never send an expired token.
+        """
+        configuration.api_key['authorization'] = self.get_token()
+        configuration.api_key_prefix['authorization'] = 'Bearer'
+        configuration.refresh_api_key_hook = lambda config: config.api_key.update(authorization=self.get_token())
+        return configuration
+
+
+ADMIN_POLICY_ARN = 'arn:aws:eks::aws:cluster-access-policy/AmazonEKSAdminPolicy'
+CLUSTER_ADMIN_POLICY_ARN = 'arn:aws:eks::aws:cluster-access-policy/AmazonEKSClusterAdminPolicy'
+ADMIN_KUBERNETES_GROUPS = ['masters'] # only given to the manager's own role, see update_access_entry()
+CLUSTER_SCOPE = {'type': 'cluster'}
+
+def access_scope_key(access_scope):
+    # hashable form of an accessScope, so scopes compare regardless of namespace order
+    access_scope = access_scope or CLUSTER_SCOPE
+    return (access_scope['type'], tuple(sorted(access_scope.get('namespaces') or ())))
 
 
 class EKSClusterManager:
-    def __init__(self, cluster_name: str, region: str, role_to_assume: str):
+    def __init__(self, cluster_name: str, region: str, role_to_assume: str, scheduler=None,
+                 credential_cache=None, session_name=None, request_timeout=None):
         self.cluster_name = cluster_name
         self.region = region
         self.role_to_assume = role_to_assume
+        self.scheduler = scheduler # optional throttle_utils.RequestScheduler for sts/eks calls
+        self.request_timeout = request_timeout # optional (connect, read) seconds for eks and kubernetes API requests
+        self.credential_cache = credential_cache or get_default_credential_cache()
+        # clusters that share a session name (and role) share credentials, session and clients
+        self.session_name = session_name or f"EksAssumeRole-{self.cluster_name}"
         self.boto_session = self.create_boto_session()
-        self.eks_client = self.boto_session.client('eks')
+        self.eks_client = self.credential_cache.client(self.role_to_assume, self.session_name, self.region, 'eks',
+                                                       scheduler=self.scheduler, request_timeout=self.request_timeout)
         self.cluster_desc = self.describe_cluster_config()
+        self.token_provider = EKSTokenProvider(
+            self.cluster_name,
+            self.region,
+            self.boto_session,
+            sts_client=self.credential_cache.client(self.role_to_assume, self.session_name, self.region, 'sts')
+        )
 
     def assume_eks_role(self):
-        sts_client = boto3.client('sts', self.region)
-        assumed_role = sts_client.assume_role(
-            RoleArn=self.role_to_assume,
-            RoleSessionName=f"EksAssumeRole-{self.cluster_name}"
-        )
-        return assumed_role['Credentials']
+        return self.credential_cache.credentials(self.role_to_assume, self.session_name, self.region)
 
     def create_boto_session(self):
-        credentials = self.assume_eks_role()
-        return boto3.Session(
-            aws_access_key_id=credentials['AccessKeyId'],
-            aws_secret_access_key=credentials['SecretAccessKey'],
-            aws_session_token=credentials['SessionToken'],
-            region_name=self.region
-        )
+        return self.credential_cache.session(self.role_to_assume, self.session_name, self.region)
+
+    def call(self, func, **kwargs):
+        return scheduled_call(self.scheduler, 'eks', func, **kwargs)
 
     def describe_cluster_config(self):
-        cluster_desc = self.eks_client.describe_cluster(name=self.cluster_name)['cluster']
+        cluster_desc = self.call(self.eks_client.describe_cluster, name=self.cluster_name)['cluster']
         return cluster_desc
 
+    def list_all(self, func, result_key, **params):
+        # follows nextToken by hand so every page goes through call()
+        output = []
+        while True:
+            page = self.call(func, **params)
+            output.extend(page[result_key])
+            if not page.get('nextToken'):
+                return output
+            params['nextToken'] = page['nextToken']
+
+    def list_access_entries(self):
+        """
+        Returns:
+            set of every principal ARN with an access entry on the cluster
+        """
+        return set(self.list_all(self.eks_client.list_access_entries, 'accessEntries', clusterName=self.cluster_name))
+
+    def list_associated_policies(self, principal_arn):
+        """
+        Returns:
+            dict of access policy ARN -> accessScope associated with the principal
+        """
+        policies = self.list_all(self.eks_client.list_associated_access_policies, 'associatedAccessPolicies',
+                                 clusterName=self.cluster_name, principalArn=principal_arn)
+        return {policy['policyArn']: policy['accessScope'] for policy in policies}
+
+    def access_entry_changes(self, desired):
+        """
+        Compares the desired access against one full listing of the cluster's access entries (and
+        the policies, plus the groups when any are desired, of the principals that already have one).
+        Groups are only ever added, an entry keeps any other groups it has.
+
+        Args:
+            desired: dict of principal ARN -> {'policies': dict of access policy ARN -> accessScope
+                (None for the whole cluster), 'kubernetes_groups': list of groups the entry must
+                include, None to leave them as is}
+
+        Returns:
+            list of (principal_arn, create_entry, kubernetes_groups, policies) for principals needing
+            writes. kubernetes_groups is the entry's full group list to set, None when the groups need
+            no change, policies is a list of (policy_arn, access_scope) to associate
+        """
+        entries = self.list_access_entries()
+        changes = []
+        for principal_arn, spec in desired.items():
+            has_entry = principal_arn in entries
+            groups = spec.get('kubernetes_groups')
+            if has_entry and groups is not None:
+                entry = self.call(self.eks_client.describe_access_entry, clusterName=self.cluster_name,
+                                  principalArn=principal_arn)['accessEntry']
+                current_groups = set(entry.get('kubernetesGroups') or [])
+                groups = None if current_groups >= set(groups) else current_groups | set(groups)
+            current = self.list_associated_policies(principal_arn) if has_entry else {}
+            policies = [
+                (policy_arn, access_scope or CLUSTER_SCOPE)
+                for policy_arn, access_scope in sorted(spec.get('policies', {}).items())
+                if policy_arn not in current or access_scope_key(current[policy_arn]) != access_scope_key(access_scope)
+            ]
+            if not has_entry or groups is not None or policies:
+                changes.append((principal_arn, not has_entry, sorted(groups) if groups is not None else None, policies))
+        return changes
+
+    def apply_access_entry_change(self, principal_arn, create_entry, kubernetes_groups, policies):
+        groups = {} if kubernetes_groups is None else {'kubernetesGroups': kubernetes_groups}
+        if create_entry:
+            self.call(self.eks_client.create_access_entry, clusterName=self.cluster_name,
+                      principalArn=principal_arn, **groups)
+        elif groups:
+            self.call(self.eks_client.update_access_entry, clusterName=self.cluster_name,
+                      principalArn=principal_arn, **groups)
+        for policy_arn, access_scope in policies: # associating again replaces the policy's scope
+            self.call(self.eks_client.associate_access_policy, clusterName=self.cluster_name,
+                      principalArn=principal_arn, policyArn=policy_arn, accessScope=access_scope)
+
     def match_access_entries(self):
-        entries = self.eks_client.list_access_entries(clusterName=self.cluster_name)['accessEntries']
-        #simple match for now. TODO: add validation via describe_access_entry() method for 'kubernetesGroups', 'scope', etc
-        return any(entry in self.role_to_assume for entry in entries)
+        return self.role_to_assume in self.list_access_entries()
 
     def update_access_entry(self):
+        # runs on every connect. a missing entry is created with the admin groups and policy, an
+        # existing one keeps its groups and only gets the admin policy if it has no cluster wide admin policy
+        admin_policy = [(ADMIN_POLICY_ARN, CLUSTER_SCOPE)]
         if not self.match_access_entries():
-            # you have to create, update, then associate the access policy with EKS cluster
-            self.eks_client.create_access_entry(clusterName=self.cluster_name, principalArn=self.role_to_assume,kubernetesGroups=['masters'])
-            # response = client.list_access_policies() #may need to list and get admin policy before applying
-            # print(response)
-            # policy = client.associate_access_policy(
-            #                                             clusterName=cluster_name,
-            #                                             principalArn='arn:aws:iam::XXX:role/XXX',
-            #                                             policyArn='arn:aws:eks::aws:cluster-access-policy/AmazonEKSAdminPolicy',
-            #                                             accessScope={
-            #                                                 'type': 'cluster'
-            #                                             }
-            #                                             )
-            # print(policy)
-            self.eks_client.update_access_entry(clusterName=self.cluster_name,principalArn=self.role_to_assume)
-            policy = self.eks_client.associate_access_policy(clusterName=self.cluster_name,
-                                                             principalArn=self.role_to_assume,
-                                                             policyArn='arn:aws:eks::aws:cluster-access-policy/AmazonEKSAdminPolicy',
-                                                            accessScope={'type': 'cluster'})
-
-            return policy['ResponseMetadata']['HTTPStatusCode'] #returns 200 if successful
-        return 304 #not modified http response code
+            self.apply_access_entry_change(self.role_to_assume, True, ADMIN_KUBERNETES_GROUPS, admin_policy)
+            return 200
+        policies = self.list_associated_policies(self.role_to_assume)
+        if any(access_scope_key(policies[policy_arn]) == access_scope_key(CLUSTER_SCOPE)
+               for policy_arn in (ADMIN_POLICY_ARN, CLUSTER_ADMIN_POLICY_ARN) if policy_arn in policies):
+            return 304 #not modified http response code
+        self.apply_access_entry_change(self.role_to_assume, False, None, admin_policy)
+        return 200
 
     def get_kube_config(self):
-        credentials = self.assume_eks_role()
+        """
+        Writes a kubeconfig for the cluster to a temporary file with a static bearer token.
+
+        The token is not refreshed: it expires at most about 14 minutes after it is written
+        (TOKEN_LIFETIME less the provider's refresh_margin), sooner if a cached token is reused.
+        The file also holds the token and CA data in plain text and is not deleted. Prefer
+        get_api_client(), or EKSTokenProvider.configure() on your own Configuration, for
+        anything that runs longer than a few minutes.
+
+        Returns:
+            Path to the kubeconfig file, None if the access entry update failed
+        """
         resp = self.update_access_entry()
         if resp in [200, 304]:
             kubeconfig = {
@@ -92,50 +415,259 @@ class EKSClusterManager:
                 'users': [{
                     'name': 'aws',
                     'user': {
-                        'exec': {
-                            'apiVersion': 'client.authentication.k8s.io/v1beta1',
-                            'command': 'aws',
-                            'args': [
-                                '--region',
-                                self.region,
-                                'eks',
-                                'get-token',
-                                '--cluster-name',
-                                self.cluster_name
-                            ],
-                            'env': [
-                                {
-                                    'name': 'AWS_ACCESS_KEY_ID',
-                                    'value': credentials['AccessKeyId']
-                                },
-                                {
-                                    'name': 'AWS_SECRET_ACCESS_KEY',
-                                    'value': credentials['SecretAccessKey']
-                                },
-                                {
-                                    'name': 'AWS_SESSION_TOKEN',
-                                    'value': credentials['SessionToken']
-                                }
-                            ]
-                        }
+                        'token': self.token_provider.get_token() # static, expires within ~14 minutes
                     }
                 }]
             }
+            import yaml
+
             config_file = tempfile.NamedTemporaryFile(delete=False, mode='wb')
             yaml.dump(kubeconfig, config_file, encoding='utf-8')
             config_file.close()
             return config_file.name
 
+    @timed('eks_api_client')
+    def get_api_client(self):
+        """
+        Builds a kubernetes ApiClient in memory from describe_cluster (endpoint and CA data) and
+        the in process token, so no kubeconfig, CA or token is ever written to disk. Requests
+        default to the manager's request_timeout.
+
+        Returns:
+            kubernetes.client.ApiClient for the cluster
+        """
+        resp = self.update_access_entry()
+        if resp not in [200, 304]:
+            raise RuntimeError(f"access entry update for {self.cluster_name} returned {resp}")
+        import kubernetes
+        import urllib3
+
+        configuration = kubernetes.client.Configuration()
+        configuration.host = self.cluster_desc['endpoint']
+        self.token_provider.configure(configuration)
+        api_client = kubernetes.client.ApiClient(configuration)
+        # the generated rest client only takes a CA file path (ssl_ca_cert), so swap in a pool
+        # manager that trusts the cluster CA straight from memory
+        ca_data = base64.b64decode(self.cluster_desc['certificateAuthority']['data']).decode('utf-8')
+        api_client.rest_client.pool_manager = urllib3.PoolManager(
+            num_pools=4,
+            maxsize=configuration.connection_pool_maxsize,
+            cert_reqs='CERT_REQUIRED',
+            ca_cert_data=ca_data
+        )
+        if self.request_timeout:
+            # the generated API methods send no timeout unless every call passes _request_timeout
+            request = api_client.rest_client.request
+
+            def request_with_timeout(*args, _request_timeout=None, **kwargs):
+                return request(*args, _request_timeout=_request_timeout or self.request_timeout, **kwargs)
+
+            api_client.rest_client.request = request_with_timeout
+        return api_client
+
+POD_PAGE_SIZE = 500
+# asks the API server for PartialObjectMetadataList: only metadata, no pod specs or statuses
+PARTIAL_METADATA_ACCEPT = 'application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1,application/json'
+
+def iter_pod_pages(api_client, namespace='default', page_size=POD_PAGE_SIZE, metadata_only=True,
+                   label_selector=None, field_selector=None):
+    """
+    Lists pods a page at a time with limit/continue and reads every page as raw JSON
+    (_preload_content=False) instead of deserializing it into V1Pod models, so memory is bounded
+    by page_size rather than by the namespace.
+
+    Yields:
+        list of pod dicts for each page, metadata only unless metadata_only is False
+    """
+    query_params = [('limit', page_size)]
+    if label_selector:
+        query_params.append(('labelSelector', label_selector))
+    if field_selector:
+        query_params.append(('fieldSelector', field_selector))
+    header_params = {'Accept': PARTIAL_METADATA_ACCEPT if metadata_only else 'application/json'}
+
+    continue_token = None
+    while True:
+        response = api_client.call_api(
+            '/api/v1/namespaces/{namespace}/pods', 'GET',
+            path_params={'namespace': namespace},
+            query_params=query_params + ([('continue', continue_token)] if continue_token else []),
+            header_params=header_params,
+            auth_settings=['BearerToken'],
+            _return_http_data_only=True,
+            _preload_content=False
+        )
+        try:
+            page = json.loads(response.data)
+        finally:
+            response.release_conn()
+        yield page.get('items') or []
+        continue_token = (page.get('metadata') or {}).get('continue')
+        if not continue_token:
+            return
+
+def count_pods(api_client, namespace='default', **kwargs):
+    return sum(len(items) for items in iter_pod_pages(api_client, namespace, **kwargs))
+
+def reconcile_access_entries(managers, desired, max_workers=8, dry_run=False):
+    """
+    Brings the access entries of many clusters to a desired state. Each cluster's entries (and the
+    policies and groups of the desired principals) are listed once with full pagination and diffed
+    against the desired set, then only missing entries, changed groups and missing or rescoped
+    policy associations are written, with principals applied concurrently. Running it again against an unchanged fleet makes no writes.
+
+    Args:
+        managers: dict of cluster_name -> EKSClusterManager used to read and write that cluster
+        desired: iterable of (cluster_name, principal_arn, policy_arn[, access_scope[, kubernetes_groups]])
+            tuples. access_scope defaults to the whole cluster, kubernetes_groups (the union of a
+            principal's tuples) to leaving the entry's groups as they are
+        max_workers: number of clusters listed, and principals written, at once
+        dry_run: only return the planned changes
+
+    Returns:
+        list of change dicts (cluster_name, principal_arn, create_entry, kubernetes_groups, policies, status, error)
+        with status 'planned', 'applied' or 'error', empty when everything already matches
+    """
+    desired_by_cluster = {}
+    for cluster_name, principal_arn, policy_arn, *options in desired:
+        access_scope, kubernetes_groups = (options + [None, None])[:2]
+        spec = desired_by_cluster.setdefault(cluster_name, {}).setdefault(
+            principal_arn, {'kubernetes_groups': None, 'policies': {}})
+        spec['policies'][policy_arn] = access_scope or CLUSTER_SCOPE
+        if kubernetes_groups is not None:
+            spec['kubernetes_groups'] = sorted(set(spec['kubernetes_groups'] or []) | set(kubernetes_groups))
+    unknown = set(desired_by_cluster) - set(managers)
+    if unknown:
+        raise ValueError(f"No EKSClusterManager for clusters: {', '.join(sorted(unknown))}")
+
+    output = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        plans = {cluster_name: executor.submit(managers[cluster_name].access_entry_changes, cluster_desired)
+                 for cluster_name, cluster_desired in desired_by_cluster.items()}
+        for cluster_name, future in plans.items():
+            try:
+                changes = future.result()
+            except Exception as e:
+                output.append({'cluster_name': cluster_name, 'principal_arn': None, 'create_entry': False,
+                               'kubernetes_groups': None, 'policies': [], 'status': 'error', 'error': str(e)})
+                continue
+            for principal_arn, create_entry, kubernetes_groups, policies in changes:
+                output.append({'cluster_name': cluster_name, 'principal_arn': principal_arn, 'create_entry': create_entry,
+                               'kubernetes_groups': kubernetes_groups, 'policies': policies,
+                               'status': 'planned', 'error': None})
+        if dry_run:
+            return output
+
+        def apply(change):
+            managers[change['cluster_name']].apply_access_entry_change(
+                change['principal_arn'], change['create_entry'], change['kubernetes_groups'], change['policies'])
+
+        planned = [change for change in output if change['status'] == 'planned']
+        for change, future in [(change, executor.submit(apply, change)) for change in planned]:
+            try:
+                future.result()
+                change['status'] = 'applied'
+            except Exception as e:
+                change['status'] = 'error'
+                change['error'] = str(e)
+    return output
+
+FLEET_SESSION_NAME = 'EksFleetAssumeRole'
+CONNECT_TIMEOUT = 10 # seconds, upper bound on connecting to an eks or kubernetes API endpoint
+
+def run_on_clusters(targets, func, max_workers=8, timeout=300, scheduler=None, credential_cache=None,
+                    deadline=None):
+    """
+    Connects to every (cluster_name, region, role_to_assume) target concurrently and runs
+    func(manager, api_client) on each one. Targets that share a role share a session name, so the
+    role is assumed once and its credentials are reused for every cluster behind it. A target
+    that fails or runs longer than timeout seconds is reported without holding up the rest.
+
+    Every eks and kubernetes API request made for a target has a (connect, read) timeout derived
+    from timeout, so a hung cluster's thread ends on its own. A timed out target hands its slot to
+    the next one straight away while its thread finishes in the background.
+
+    Args:
+        targets: list of (cluster_name, region, role_to_assume) tuples
+        func: callable taking (EKSClusterManager, kubernetes.client.ApiClient)
+        max_workers: number of clusters worked on at once
+        timeout: seconds a single cluster may take, counted from when it is started
+        scheduler: Optional throttle_utils.RequestScheduler shared by every cluster's sts/eks calls
+        deadline: Optional seconds for the whole run. Targets still running or not yet started
+            when it passes are reported as timed out
+
+    Returns:
+        list of result dicts in target order with cluster_name, region, role_to_assume,
+        status ('ok', 'error' or 'timeout'), result, error and seconds
+    """
+    credential_cache = credential_cache or get_default_credential_cache()
+    request_timeout = (min(CONNECT_TIMEOUT, timeout), timeout)
+
+    def run(cluster_name, region, role_to_assume):
+        with stage_timer('eks_connect'):
+            eks = EKSClusterManager(cluster_name, region, role_to_assume, scheduler=scheduler,
+                                    credential_cache=credential_cache, session_name=FLEET_SESSION_NAME,
+                                    request_timeout=request_timeout)
+            api_client = eks.get_api_client()
+        try:
+            return func(eks, api_client)
+        finally:
+            api_client.close()
+
+    output = [
+        {'cluster_name': cluster_name, 'region': region, 'role_to_assume': role_to_assume,
+         'status': 'timeout', 'result': None, 'error': None, 'seconds': None}
+        for cluster_name, region, role_to_assume in targets
+    ]
+    run_until = time.monotonic() + deadline if deadline is not None else None
+    running = {} # future -> (target index, started at)
+    next_target = 0
+    # max_workers is enforced by running, the executor gets a thread per target so a timed out
+    # worker that is still blocked does not hold up the targets after it
+    executor = ThreadPoolExecutor(max_workers=max(len(targets), 1))
+    try:
+        while next_target < len(targets) or running:
+            while next_target < len(targets) and len(running) < max_workers:
+                running[executor.submit(run, *targets[next_target])] = (next_target, time.monotonic())
+                next_target += 1
+            # wake up when something finishes, the oldest running cluster hits its timeout or the run its deadline
+            deadlines = [started + timeout for _, started in running.values()]
+            if run_until is not None:
+                deadlines.append(run_until)
+            done, _ = wait(running, timeout=max(min(deadlines) - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in done:
+                index, started = running.pop(future)
+                entry = output[index]
+                entry['seconds'] = now - started
+                try:
+                    entry['result'] = future.result()
+                    entry['status'] = 'ok'
+                except Exception as e:
+                    entry['error'] = str(e)
+                    entry['status'] = 'error'
+            for future, (index, started) in list(running.items()):
+                if now - started >= timeout:
+                    del running[future]
+                    output[index]['error'] = f"timed out after {timeout}s"
+                    output[index]['seconds'] = now - started
+            if run_until is not None and now >= run_until:
+                break
+        for index, started in running.values():
+            output[index]['error'] = f"still running at the {deadline}s deadline"
+            output[index]['seconds'] = time.monotonic() - started
+        for index in range(next_target, len(targets)):
+            output[index]['error'] = f"not started before the {deadline}s deadline"
+    finally:
+        # timed out workers are left to finish in the background instead of blocking the caller
+        executor.shutdown(wait=False, cancel_futures=True)
+    return output
+
 def main():
     AWS_REGION= 'us-east-1'
     eks = EKSClusterManager('YOUR_CLUSTER_NAME',region = AWS_REGION, role_to_assume='arn:aws:iam::AWS_ACCOUNT_NUMBER:role/ROLE_NAME' )
-    kubeconfig = eks.get_kube_config()
-    kubernetes.config.load_kube_config(kubeconfig)
-
-    api = kubernetes.client.CoreV1Api()
-    pods = api.list_namespaced_pod(namespace='default')
-    print(pods)
-    print(f'Found {len(pods.items)} pods')
-    os.remove(kubeconfig)
+    api_client = eks.get_api_client()
+
+    print(f"Found {count_pods(api_client, namespace='default')} pods")
 if __name__=="__main__":
     main()
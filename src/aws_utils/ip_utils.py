@@ -1,56 +1,267 @@
 import asyncio
+import bisect
+import ipaddress
 import json
-import aiodns
-import boto3
 import os
-from functools import partial
+import time
+from concurrent.futures import ThreadPoolExecutor
+from aws_utils.client_utils import get_client
+from aws_utils.dns_utils import get_default_resolver
+from aws_utils.metrics_utils import STAGE_SECONDS, get_active_metrics, stage_timer, timed
+from aws_utils.throttle_utils import scheduled_call
 
+try:
+    import orjson # optional fast JSON backend: pip install aws_utils[fast]
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
-def config_query(aggregator_name, queries):
+
+def iter_config_query_pages(aggregator_name, queries, page_size=None, client=None, scheduler=None):
+    """
+    Generator for querying AWS Config one page at a time. Follows NextToken
+    until every page of every query has been read.
+
+    Args:
+        aggregator_name: Name of config aggregator. Is set in load_config()
+        queries: SQL like query for AWS Config. Is set in load_config()
+        page_size: Optional Limit passed to select_aggregate_resource_config (max 100)
+        client: Optional boto3 config client. The shared client_utils one is used if not set
+        scheduler: Optional throttle_utils.RequestScheduler every page request goes through
+
+    Yields:
+        List of parsed AWS Config query results for each page
+    """
+    if client is None:
+        client = get_client('config', 'us-east-1', scheduler=scheduler)
+    for q in queries.values():
+        params = {
+            'Expression': q,
+            'ConfigurationAggregatorName': aggregator_name
+        }
+        if page_size:
+            params['Limit'] = page_size
+        while True:
+            response = scheduled_call(scheduler, 'config', client.select_aggregate_resource_config, **params)
+            with stage_timer('parse_page'):
+                page = [json_loads(line) for line in response["Results"]]
+            yield page
+            next_token = response.get('NextToken')
+            if not next_token:
+                break
+            params['NextToken'] = next_token
+
+def iter_config_query(aggregator_name, queries, page_size=None, client=None, scheduler=None):
+    """
+    Generator for querying AWS Config. Yields parsed records as each page comes in.
+
+    Args:
+        aggregator_name: Name of config aggregator. Is set in load_config()
+        queries: SQL like query for AWS Config. Is set in load_config()
+        page_size: Optional Limit passed to select_aggregate_resource_config (max 100)
+        client: Optional boto3 config client. The shared client_utils one is used if not set
+        scheduler: Optional throttle_utils.RequestScheduler every page request goes through
+
+    Yields:
+        AWS Config query results
+    """
+    for page in iter_config_query_pages(aggregator_name, queries, page_size, client, scheduler):
+        yield from page
+
+class ConfigQueryError(Exception):
+    """
+    Raised once every concurrent query has finished if any of them failed, so callers never
+    mistake partial results for a complete inventory.
+
+    Args:
+        failures: dict of query name -> exception
+        results: what the other queries returned (formatted records for async_config_query())
+    """
+
+    def __init__(self, failures, results=None):
+        self.failures = failures
+        self.results = results if results is not None else []
+        super().__init__('config queries failed: ' + ', '.join(f'{name} ({error})' for name, error in failures.items()))
+
+def _query_pages_safe(name, aggregator_name, query, page_size, client, scheduler=None):
+    """
+    Runs a single query to completion without letting its error abort the other queries.
+
+    Returns:
+        Tuple of (list of results, exception or None)
+    """
+    output = []
+    try:
+        for page in iter_config_query_pages(aggregator_name, {name: query}, page_size, client, scheduler):
+            output.extend(page)
+    except Exception as e:
+        print(f"config query {name} failed: {e}")
+        return output, e
+    return output, None
+
+@timed('config_query')
+def config_query(aggregator_name, queries, page_size=None, client=None, max_workers=None, scheduler=None):
     """
     Function for querying AWS Config.
 
     Args:
         aggregator_name: Name of config aggregator. Is set in load_config()
         queries: SQL like query for AWS Config. Is set in load_config()
+        page_size: Optional Limit passed to select_aggregate_resource_config (max 100)
+        client: Optional boto3 config client. The shared client_utils one is used if not set
+        max_workers: If set, runs every query concurrently with this many threads.
+                     Results are merged in query order
+        scheduler: Optional throttle_utils.RequestScheduler. Page requests are rate limited by it and,
+                   when max_workers is not set, queries run concurrently on its thread pool
 
     Returns:
         List of AWS Config query results
+
+    Raises:
+        ConfigQueryError: a concurrent query failed, raised after the others finished with their results attached
     """
-    output = list()
-    client = boto3.client('config', region_name='us-east-1')
-    for q in queries.values():
-        response = client.select_aggregate_resource_config(
-            Expression=q,
-            ConfigurationAggregatorName=aggregator_name
-        )
-        results = response["Results"]
-        json_output = [json.loads(line) for line in results]
-        output.extend(json_output)
+    if not max_workers and scheduler is None:
+        return list(iter_config_query(aggregator_name, queries, page_size, client))
+
+    if client is None:
+        client = get_client('config', 'us-east-1', scheduler=scheduler) # boto3 clients are thread safe
+    executor = ThreadPoolExecutor(max_workers=max_workers) if max_workers else None
+    submit = executor.submit if executor else scheduler.submit
+    output = []
+    failures = {}
+    try:
+        futures = {
+            name: submit(_query_pages_safe, name, aggregator_name, q, page_size, client, scheduler)
+            for name, q in queries.items()
+        }
+        for name, future in futures.items(): # iterate in submit order so results are stable
+            results, error = future.result()
+            output.extend(results)
+            if error is not None:
+                failures[name] = error
+    finally:
+        if executor:
+            executor.shutdown()
+    if failures:
+        raise ConfigQueryError(failures, output)
     return output
 
-async def async_config_query(aggregator_name, queries):
+async def aiter_config_query(aggregator_name, queries, page_size=None, prefetch=2, max_workers=None, client=None,
+                             scheduler=None):
+    """
+    Async generator for iter_config_query_pages(). Pages are fetched in an executor
+    and buffered, so the next page is already being fetched while the current one is consumed.
+
+    Args:
+        aggregator_name: Name of config aggregator is set in load_config()
+        queries: SQL like query for AWS Config. Is set in load_config()
+        page_size: Optional Limit passed to select_aggregate_resource_config (max 100)
+        prefetch: Max number of pages held in memory ahead of the consumer (per query)
+        max_workers: If set, every query is fetched concurrently with this many threads.
+                     Records are still yielded in query order
+        client: Optional boto3 config client. The shared client_utils one is used if not set
+        scheduler: Optional throttle_utils.RequestScheduler every page request goes through
+
+    Yields:
+        AWS Config query results
+
+    Raises:
+        ConfigQueryError: after the last record, if a concurrent query failed
+    """
+    loop = asyncio.get_running_loop()
+    done = object()
+    executor = None
+    failures = {}
+
+    if client is None:
+        client = get_client('config', 'us-east-1', scheduler=scheduler)
+    if max_workers:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        sources = [
+            (name, iter_config_query_pages(aggregator_name, {name: q}, page_size, client, scheduler))
+            for name, q in queries.items()
+        ]
+    else:
+        sources = [(None, iter_config_query_pages(aggregator_name, queries, page_size, client, scheduler))]
+
+    async def producer(name, pages, queue):
+        try:
+            while True:
+                page = await loop.run_in_executor(executor, next, pages, done)
+                await queue.put(page)
+                if page is done:
+                    break
+        except Exception as e:
+            if name is None:
+                await queue.put(e)
+            else:
+                print(f"config query {name} failed: {e}")
+                failures[name] = e
+                await queue.put(done)
+
+    queues = [asyncio.Queue(maxsize=prefetch) for _ in sources]
+    tasks = [
+        asyncio.create_task(producer(name, pages, queue))
+        for (name, pages), queue in zip(sources, queues)
+    ]
+    try:
+        for queue in queues: # drain in query order so output is stable
+            while True:
+                page = await queue.get()
+                if page is done:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                for record in page:
+                    yield record
+    finally:
+        for task in tasks:
+            task.cancel()
+        if executor:
+            executor.shutdown(wait=False)
+    if failures:
+        raise ConfigQueryError(failures)
+
+async def async_config_query(aggregator_name, queries, page_size=None, max_workers=None, client=None, resolver=None,
+                             scheduler=None):
     """
     Async wrapper for config_query(). Required when using asyncio.
+    Formatting starts on the first page while later pages are still being fetched.
 
     Args:
         aggregator_name: Name of config aggregator is set in load_config()
         queries: SQL like query for AWS Config. Is set in load_config()
+        page_size: Optional Limit passed to select_aggregate_resource_config (max 100)
+        max_workers: If set, every query is fetched concurrently with this many threads
+        client: Optional boto3 config client. The shared client_utils one is used if not set
+        resolver: Optional dns_utils.CachingResolver
+        scheduler: Optional throttle_utils.RequestScheduler every page request goes through
 
     Returns:
         List of formatted AWS resources and their public IP's
+
+    Raises:
+        ConfigQueryError: a concurrent query failed, with the other queries' formatted records attached
     """
-    loop = asyncio.get_running_loop()
-    func = partial(config_query, aggregator_name, queries) 
-    results = await loop.run_in_executor(None, func)
-    formatted_results = [json.dumps(item) for item in results]
-    output = await fmt_output_async(formatted_results)
+    errors = []
+
+    async def results():
+        try:
+            async for record in aiter_config_query(aggregator_name, queries, page_size, max_workers=max_workers,
+                                                   client=client, scheduler=scheduler):
+                yield record
+        except ConfigQueryError as e: # finish formatting what did arrive before raising
+            errors.append(e)
+
+    output = await fmt_output_async(results(), resolver)
+    if errors:
+        raise ConfigQueryError(errors[0].failures, output)
     return output
 
 def search_for_ip(data, search_ip):
     """
     Function for finding an AWS resource with a specific public IP. 
-    Should use output from async_config_query().
+    Should use output from async_config_query(). Use IPIndex when searching for many IPs.
 
     Args:
         data: JSON output from async_config_query()
@@ -69,109 +280,267 @@ def search_for_ip(data, search_ip):
             output.append(d)
     return output
 
+class IPIndex:
+    """
+    Index over output from async_config_query() / fmt_output_async() for
+    looking up many IPs at once. Built once in O(N), then exact lookups are O(1)
+    and CIDR range queries use a sorted list of integer addresses.
+
+    Args:
+        data: JSON output from async_config_query()
+    """
+
+    def __init__(self, data):
+        self.records = list(data)
+        self._by_ip = {} # ip_address -> list of record positions
+        for pos, d in enumerate(self.records):
+            ips = set()
+            public_ip = d.get('publicIp')
+            if public_ip:
+                ips.add(public_ip)
+            ips.update(d.get('resolvedIps') or [])
+            for ip in ips:
+                try:
+                    addr = ipaddress.ip_address(ip)
+                except ValueError:
+                    continue
+                positions = self._by_ip.setdefault(addr, [])
+                if not positions or positions[-1] != pos: # same record via publicIp and resolvedIps
+                    positions.append(pos)
+        self._sorted = sorted(self._by_ip, key=lambda a: (a.version, int(a)))
+        self._sorted_keys = [(a.version, int(a)) for a in self._sorted]
+
+    def __len__(self):
+        return len(self._by_ip)
+
+    def lookup(self, search_ip):
+        """
+        Args:
+            search_ip: string of IP to search for
+
+        Returns:
+            List of matching resources
+        """
+        try:
+            addr = ipaddress.ip_address(search_ip)
+        except ValueError:
+            return []
+        return [self.records[pos] for pos in self._by_ip.get(addr, [])]
+
+    def lookup_many(self, search_ips):
+        """
+        Args:
+            search_ips: list of IP strings to search for
+
+        Returns:
+            Dict of IP to list of matching resources. IPs without a match are left out
+        """
+        output = {}
+        for ip in search_ips:
+            matches = self.lookup(ip)
+            if matches:
+                output[ip] = matches
+        return output
+
+    def in_network(self, cidr):
+        """
+        Args:
+            cidr: network string, e.g. '52.10.0.0/16'
+
+        Returns:
+            List of resources with an IP inside the network, each listed once
+        """
+        network = ipaddress.ip_network(cidr, strict=False)
+        lo = bisect.bisect_left(self._sorted_keys, (network.version, int(network.network_address)))
+        hi = bisect.bisect_right(self._sorted_keys, (network.version, int(network.broadcast_address)))
+        seen = set()
+        output = []
+        for addr in self._sorted[lo:hi]:
+            for pos in self._by_ip[addr]:
+                if pos not in seen:
+                    seen.add(pos)
+                    output.append(self.records[pos])
+        return output
+
 # some examples: https://snyk.io/advisor/python/aiodns/example
 # docs: https://github.com/aio-libs/aiodns
-async def resolve_dns_async(hostname: str):
+async def resolve_dns_async(hostname: str, resolver=None):
     """
     Async func to resolve FQDN's to IPv4
 
     Args:
         hostname: FQDN string
+        resolver: Optional dns_utils.CachingResolver. The shared default resolver is used if not set
 
     Returns:
-        List of resolved public IP addresses
+        List of resolved public IP addresses. Empty if the name does not resolve or the lookup failed
     """
-    try:
-        resolver = aiodns.DNSResolver()
-        results = await asyncio.gather(
-            resolver.query(hostname, 'A'), #Just A records for now
-            return_exceptions=True
-        )
-        ip_addresses = set()
-        for result in results:
-            if isinstance(result, Exception):
-                continue
-            ip_addresses.update(r.host for r in result) # type: ignore
-        return list(ip_addresses)
-    except Exception as e:
-        return list(f"failed to resolve: {e}")
+    if resolver is None:
+        resolver = get_default_resolver()
+    with stage_timer('dns'):
+        try:
+            return await resolver.resolve(hostname)
+        except Exception: # counted in resolver.stats()['errors']
+            return []
 
 
-async def fmt_output_async(result_contents):
+class ResourceExtractor:
     """
-    Formats output from AWS Config search and resolves FQDN's
+    Describes how aiter_fmt_output() builds a record for one AWS Config resource type.
+    Paths are split once when the extractor is created.
 
     Args:
-        result_contents: A list of JSON object output from AWS Config query
+        fields: Dict of output key to dotted path under 'configuration', e.g. {'publicIp': 'association.publicIp'}
+        hostname_path: Dotted path of the FQDN to resolve. None if the resource has a public IP already
+        strip_prefix: Optional prefix removed from the hostname, e.g. 'https://'
+    """
 
-    Returns:
-        List of JSON objects with public IP's
+    def __init__(self, fields=None, hostname_path=None, strip_prefix=None):
+        self.fields = [(key, tuple(path.split('.'))) for key, path in (fields or {}).items()]
+        self.hostname_path = tuple(hostname_path.split('.')) if hostname_path else None
+        self.strip_prefix = strip_prefix
+        self.needs_dns = self.hostname_path is not None
+
+def get_path(config, path):
     """
-    output = []
-    dns_tasks = []
+    Walks a split dotted path through nested dicts. Returns None if any key is missing.
+    """
+    value = config
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+# keyed on the exact resourceType returned by AWS Config. Use register_extractor() to add
+# new public IP sources (NAT gateways, CloudFront, API Gateway, etc) along with a query in CONFIG_QUERIES
+RESOURCE_EXTRACTORS = {
+    'AWS::EC2::NetworkInterface': ResourceExtractor(fields={'publicIp': 'association.publicIp'}),
+    'AWS::EC2::EIP': ResourceExtractor(fields={
+        'publicIp': 'publicIp',
+        'networkInterfaceId': 'networkInterfaceId'
+    }),
+    'AWS::RDS::DBInstance': ResourceExtractor(hostname_path='endpoint.address'),
+    'AWS::ElasticLoadBalancingV2::LoadBalancer': ResourceExtractor(hostname_path='dNSName'),
+    'AWS::EKS::Cluster': ResourceExtractor(
+        fields={
+            'eksEndpointPrivateAccess': 'resourcesVpcConfig.endpointPrivateAccess',
+            'eksEndpointPublicAccess': 'resourcesVpcConfig.endpointPublicAccess',
+            'eksPublicAccessCidrs': 'resourcesVpcConfig.publicAccessCidrs'
+        },
+        hostname_path='Endpoint',
+        strip_prefix='https://' #remove https:// from endpoint
+    )
+}
+
+def register_extractor(resource_type, extractor):
+    """
+    Adds or replaces the extractor used for a resource type.
+
+    Args:
+        resource_type: AWS Config resourceType, e.g. 'AWS::EC2::NatGateway'
+        extractor: ResourceExtractor
+    """
+    RESOURCE_EXTRACTORS[resource_type] = extractor
+
+async def _aiter(items):
+    """
+    Iterates over a regular or async iterable from async code.
+    """
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+async def aiter_fmt_output(result_contents, resolver=None, known_ips=None):
+    """
+    Async generator version of fmt_output_async(). Records without a hostname are yielded
+    as soon as they are read, records that need DNS are yielded once their lookups finish.
+
+    Args:
+        result_contents: A list (or async iterable) of parsed AWS Config query results.
+                         Raw JSON strings are still accepted and parsed
+        resolver: Optional dns_utils.CachingResolver passed to resolve_dns_async()
+        known_ips: Optional dict of hostname to already resolved IPs. These hostnames are not looked up again
+
+    Yields:
+        JSON objects with public IP's
+    """
+    dns_tasks = {} # one lookup per unique hostname
     templates = []
+    metrics = get_active_metrics() # per record parse timing only while instrumentation is enabled
+
+    def add_dns_task(hostname):
+        if hostname in dns_tasks:
+            return
+        if known_ips and hostname in known_ips:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(known_ips[hostname])
+            dns_tasks[hostname] = future
+        else:
+            dns_tasks[hostname] = asyncio.ensure_future(resolve_dns_async(hostname, resolver))
 
-    for entry in result_contents:
-        parse_entry = json.loads(entry)
-        config = parse_entry.get('configuration')
-        account_id = parse_entry.get('accountId')
-        resource_id = parse_entry.get('resourceId')
-        resource_name = parse_entry.get('resourceName')
-        region = parse_entry.get('awsRegion')
+    async for entry in _aiter(result_contents):
+        if not isinstance(entry, (str, bytes)):
+            parse_entry = entry
+        elif metrics is None:
+            parse_entry = json_loads(entry)
+        else:
+            parse_start = time.perf_counter()
+            parse_entry = json_loads(entry)
+            metrics.observe(STAGE_SECONDS, time.perf_counter() - parse_start, stage='parse')
         resource_type = parse_entry.get('resourceType')
+        extractor = RESOURCE_EXTRACTORS.get(resource_type) # dict dispatch on the exact type
+        if extractor is None:
+            continue
+        config = parse_entry.get('configuration') or {}
 
         template_base = {
-            'accountId': account_id,
-            'resourceId': resource_id,
-            'resourceName': resource_name,
-            'region': region,
+            'accountId': parse_entry.get('accountId'),
+            'resourceId': parse_entry.get('resourceId'),
+            'resourceName': parse_entry.get('resourceName'),
+            'region': parse_entry.get('awsRegion'),
             'resourceType': resource_type
         }
-
-        if 'AWS::EC2::NetworkInterface' in resource_type:
-            template = template_base | {
-                'publicIp': config.get('association', {}).get('publicIp') #returns empty dict if nested one doesnt exist (https://www.w3schools.com/python/ref_dictionary_get.asp)
-            }
-            output.append(template)
-        elif 'AWS::EC2::EIP' in resource_type:
-            template = template_base | {
-                'publicIp': config.get('publicIp'),
-                'networkInterfaceId': config.get('networkInterfaceId')
-            }
-            output.append(template)
-        elif 'AWS::RDS::DBInstance' in resource_type:
-            hostname = config.get('endpoint', {}).get('address')
-            if hostname:
-                dns_tasks.append(resolve_dns_async(hostname)) #add all fqdns that need to be resolved to a list
-                templates.append((template_base, hostname, len(dns_tasks) - 1)) # set an index for "dns_tasks"
-        elif 'AWS::ElasticLoadBalancingV2::LoadBalancer' in resource_type:
-            hostname = config.get('dNSName')
-            if hostname:
-                dns_tasks.append(resolve_dns_async(hostname))
-                templates.append((template_base, hostname, len(dns_tasks) - 1))
-        elif "AWS::EKS::Cluster" in resource_type:
-            endpoint = config.get('Endpoint')
-            if endpoint:
-                hostname = endpoint.replace("https://", "") #remove https:// from endpoint
-                dns_tasks.append(resolve_dns_async(hostname))
-                eks_config = {
-                    'eksEndpointPrivateAccess': config.get('resourcesVpcConfig', {}).get('endpointPrivateAccess'),
-                    'eksEndpointPublicAccess': config.get('resourcesVpcConfig', {}).get('endpointPublicAccess'),
-                    'eksPublicAccessCidrs': config.get('resourcesVpcConfig', {}).get('publicAccessCidrs')
-                }
-                template_base.update(eks_config)
-                templates.append((template_base, hostname, len(dns_tasks) - 1))
+        for key, path in extractor.fields:
+            template_base[key] = get_path(config, path)
+        if not extractor.needs_dns:
+            yield template_base
+            continue
+        hostname = get_path(config, extractor.hostname_path)
+        if hostname:
+            if extractor.strip_prefix:
+                hostname = hostname.replace(extractor.strip_prefix, "")
+            add_dns_task(hostname) #add all fqdns that need to be resolved
+            templates.append((template_base, hostname))
     if dns_tasks:
-        dns_results = await asyncio.gather(*dns_tasks)
-        for template_base, hostname, index in templates: #im referencing the index we set via "len((dns_tasks) - 1)"
-            resolved_ips = dns_results[index]
+        await asyncio.gather(*dns_tasks.values())
+        for template_base, hostname in templates:
+            resolved_ips = list(dns_tasks[hostname].result())
             template = template_base | {
                 'resolvedIps': resolved_ips,
                 'fqdn': hostname
             }
-            output.append(template)
+            yield template
 
-    return output
+async def fmt_output_async(result_contents, resolver=None, known_ips=None):
+    """
+    Formats output from AWS Config search and resolves FQDN's.
+    DNS lookups are started as soon as each entry is read.
+
+    Args:
+        result_contents: A list (or async iterable) of parsed AWS Config query results.
+                         Raw JSON strings are still accepted and parsed
+        resolver: Optional dns_utils.CachingResolver passed to resolve_dns_async()
+        known_ips: Optional dict of hostname to already resolved IPs. These hostnames are not looked up again
+
+    Returns:
+        List of JSON objects with public IP's
+    """
+    with stage_timer('fmt_output'):
+        return [record async for record in aiter_fmt_output(result_contents, resolver, known_ips)]
 
 def default_queries():
     """
@@ -241,8 +610,9 @@ def load_config():
     config = {
         "PRINT":os.environ.get('PRINT', False),
         "SAVE_FILE":os.environ.get('SAVE_FILE', False),
-        "SAVE_FILE_NAME": os.environ.get('SAVE_FILE_NAME', 'all_public_ips_FORMATTED.json'),
+        "SAVE_FILE_NAME": os.environ.get('SAVE_FILE_NAME', 'all_public_ips_FORMATTED.ndjson'),
         "SEARCH_IP": os.environ.get('SEARCH_IP'),
+        "SNAPSHOT_FILE": os.environ.get('SNAPSHOT_FILE'), # enables incremental refresh via snapshot_utils
         "AGGREGATOR_NAME": agg_name,
         "CONFIG_QUERIES": os.environ.get('CONFIG_QUERIES', default_queries()),
     }
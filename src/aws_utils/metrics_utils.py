@@ -0,0 +1,252 @@
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from aws_utils.throttle_utils import THROTTLE_CODES
+
+# seconds, spans a cached DNS answer up to a slow paginated Cost Explorer call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+API_CALL_SECONDS = 'aws_api_call_seconds'
+API_CALLS_TOTAL = 'aws_api_calls_total'
+API_RETRIES_TOTAL = 'aws_api_retries_total'
+API_THROTTLES_TOTAL = 'aws_api_throttles_total'
+STAGE_SECONDS = 'aws_utils_stage_seconds'
+
+HELP = {
+    API_CALL_SECONDS: 'AWS API call latency including botocore retries',
+    API_CALLS_TOTAL: 'AWS API calls by final status (ok or the error code)',
+    API_RETRIES_TOTAL: 'Retries botocore made inside AWS API calls',
+    API_THROTTLES_TOTAL: 'AWS API calls that ended in a throttling error',
+    STAGE_SECONDS: 'Latency of aws_utils pipeline stages'
+}
+
+
+class Histogram:
+    """
+    Fixed bucket latency histogram. Quantiles are estimated as the upper bound of the
+    bucket they fall in, the same way Prometheus' histogram_quantile() would bound them.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99)
+        }
+
+
+class Metrics:
+    """
+    Thread safe registry of labelled histograms and counters.
+
+    Exported as a JSON summary with to_json() or in the Prometheus text exposition
+    format with to_prometheus().
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {} # (name, sorted label items) -> Histogram
+        self._counters = {} # (name, sorted label items) -> number
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def summary(self):
+        """
+        Returns:
+            dict of metric name -> list of {'labels', ...} entries, histograms summarised
+        """
+        output = {}
+        with self._lock:
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                output.setdefault(name, []).append({'labels': dict(labels)} | histogram.summary())
+            for (name, labels), value in sorted(self._counters.items()):
+                output.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        return output
+
+    def to_json(self, indent=None):
+        return json.dumps(self.summary(), indent=indent)
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), histogram in histograms:
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            declare(name, 'counter')
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+# set by enable_instrumentation(), every hook and timer is a no-op while this is None
+_active_metrics = None
+
+def get_active_metrics():
+    return _active_metrics
+
+def enable_instrumentation(metrics=None, client_pool=None):
+    """
+    Turns instrumentation on: every client in the shared client_utils pool (existing and future)
+    reports its API calls, and the pipeline stage timers start recording.
+
+    Returns:
+        The Metrics instance being recorded to
+    """
+    global _active_metrics
+    from aws_utils.client_utils import get_default_client_pool
+
+    _active_metrics = metrics or _active_metrics or Metrics()
+    (client_pool or get_default_client_pool()).add_client_hook(instrument_client)
+    return _active_metrics
+
+def disable_instrumentation():
+    global _active_metrics
+    _active_metrics = None
+
+def _before_call(model, context, **kwargs):
+    if _active_metrics is not None:
+        context['aws_utils_call'] = (time.perf_counter(), model)
+
+def _record_call(context, status, retries=0):
+    call = context.pop('aws_utils_call', None)
+    if _active_metrics is None or call is None:
+        return
+    start, model = call
+    labels = {'service': model.service_model.service_name, 'operation': model.name}
+    _active_metrics.observe(API_CALL_SECONDS, time.perf_counter() - start, **labels)
+    _active_metrics.inc(API_CALLS_TOTAL, status=status, **labels)
+    if retries:
+        _active_metrics.inc(API_RETRIES_TOTAL, retries, **labels)
+    if status in THROTTLE_CODES:
+        _active_metrics.inc(API_THROTTLES_TOTAL, **labels)
+
+def _after_call(http_response, parsed, context, **kwargs):
+    status = 'ok' if http_response.status_code < 300 else parsed.get('Error', {}).get('Code', str(http_response.status_code))
+    _record_call(context, status, parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0))
+
+def _after_call_error(exception, context, **kwargs):
+    # connection and timeout errors raised inside botocore never reach after-call
+    _record_call(context, type(exception).__name__)
+
+def instrument_client(client):
+    """
+    Registers before-call/after-call hooks on a boto3 client. They only record while
+    instrumentation is enabled, and registering the same client twice is a no-op.
+    """
+    events = client.meta.events
+    # registered as specific as (and ahead of) botocore Stubber style handlers that answer before-call themselves
+    events.register_first('before-call.*.*', _before_call, unique_id='aws_utils-metrics-before-call')
+    events.register('after-call.*.*', _after_call, unique_id='aws_utils-metrics-after-call')
+    events.register('after-call-error.*.*', _after_call_error, unique_id='aws_utils-metrics-after-call-error')
+    return client
+
+@contextmanager
+def stage_timer(stage):
+    """
+    Times a block into aws_utils_stage_seconds{stage=...} while instrumentation is enabled.
+    """
+    metrics = _active_metrics
+    if metrics is None:
+        yield
+        return
+    with metrics.timer(STAGE_SECONDS, stage=stage):
+        yield
+
+def timed(stage):
+    """
+    Decorator version of stage_timer() for functions returning their result (not generators).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active_metrics is None:
+                return func(*args, **kwargs)
+            with _active_metrics.timer(STAGE_SECONDS, stage=stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,153 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from aws_utils.ip_utils import RESOURCE_EXTRACTORS, aiter_config_query, async_config_query, fmt_output_async
+
+# aggregators deliver items late and local clocks drift, so each delta re-reads this much before
+# the last sync. Re-read items are upserted by record_key(), so the overlap is harmless
+SYNC_OVERLAP = timedelta(minutes=15)
+
+
+def record_key(record):
+    """
+    Key used to match resources between syncs. Works for raw AWS Config
+    results ('awsRegion') and fmt_output_async() output ('region').
+    """
+    return (
+        record.get('accountId'),
+        record.get('region', record.get('awsRegion')),
+        record.get('resourceType'),
+        record.get('resourceId')
+    )
+
+def load_snapshot(path):
+    """
+    Args:
+        path: snapshot file written by save_snapshot()
+
+    Returns:
+        Dict with 'lastSync' and 'records', or None if there is no snapshot yet
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_snapshot(path, records, last_sync):
+    """
+    Writes the inventory to a temp file then renames it so a failed run never leaves a partial snapshot.
+
+    Args:
+        path: snapshot file path
+        records: fmt_output_async() output
+        last_sync: datetime the inventory was queried at
+    """
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'lastSync': fmt_capture_time(last_sync), 'records': records}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def fmt_capture_time(ts):
+    return ts.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+def parse_capture_time(value):
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.000Z').replace(tzinfo=timezone.utc)
+
+def delta_queries(queries, since):
+    """
+    Restricts each query to items captured after the last sync.
+
+    Args:
+        queries: SQL like query for AWS Config. Is set in load_config()
+        since: configurationItemCaptureTime string of the last sync
+
+    Returns:
+        Dict of queries with a configurationItemCaptureTime filter added
+    """
+    return {
+        name: f"{q.rstrip()}\n        AND configurationItemCaptureTime > '{since}'"
+        for name, q in queries.items()
+    }
+
+def changed_items_query(since, resource_types):
+    """
+    Query for every item of resource_types that changed after the last sync, including
+    ones that were deleted or no longer match the public IP queries.
+    """
+    types = ', '.join(f"'{t}'" for t in resource_types)
+    return f"""
+        SELECT accountId, resourceId, resourceType, awsRegion, configurationItemStatus
+        WHERE resourceType IN ({types})
+        AND configurationItemCaptureTime > '{since}'
+    """
+
+async def refresh_inventory(aggregator_name, queries, snapshot_path, page_size=None, max_workers=None,
+                            resolver=None, resource_types=None, overlap=SYNC_OVERLAP, client=None, scheduler=None):
+    """
+    Incremental version of async_config_query(). The first run pulls the full inventory and
+    saves it to snapshot_path. Later runs only query items whose configurationItemCaptureTime is
+    newer than the last sync, drop deleted items and only resolve hostnames that changed.
+
+    Args:
+        aggregator_name: Name of config aggregator is set in load_config()
+        queries: SQL like query for AWS Config. Is set in load_config()
+        snapshot_path: local file used to store the last inventory
+        page_size: Optional Limit passed to select_aggregate_resource_config (max 100)
+        max_workers: If set, every query is fetched concurrently with this many threads
+        resolver: Optional dns_utils.CachingResolver
+        resource_types: resource types covered by queries. Defaults to every type in ip_utils.RESOURCE_EXTRACTORS
+        overlap: timedelta subtracted from the last sync when building the delta filter
+        client: Optional boto3 config client. The pooled client is used if not set
+        scheduler: Optional throttle_utils.RequestScheduler for the select_aggregate_resource_config calls
+
+    Returns:
+        Tuple of (list of formatted AWS resources and their public IP's, dict of refresh stats)
+    """
+    sync_start = datetime.now(timezone.utc) # taken before querying so nothing changed mid-run is missed
+    snapshot = load_snapshot(snapshot_path)
+    if snapshot is None:
+        records = await async_config_query(aggregator_name, queries, page_size, max_workers, client=client,
+                                           resolver=resolver, scheduler=scheduler)
+        save_snapshot(snapshot_path, records, sync_start)
+        return records, {'full': True, 'records': len(records)}
+
+    since = fmt_capture_time(parse_capture_time(snapshot['lastSync']) - overlap)
+    resource_types = resource_types or tuple(RESOURCE_EXTRACTORS)
+    changed = {}
+    deleted = set()
+    changed_query = {'CHANGED': changed_items_query(since, resource_types)}
+    async for item in aiter_config_query(aggregator_name, changed_query, page_size, client=client, scheduler=scheduler):
+        key = record_key(item)
+        changed[key] = item
+        if item.get('configurationItemStatus') == 'ResourceDeleted':
+            deleted.add(key)
+
+    known_ips = {}
+    records = {}
+    for record in snapshot['records']:
+        key = record_key(record)
+        if key in changed:
+            if record.get('fqdn'): # reuse lookups for endpoints whose hostname did not change
+                known_ips[record['fqdn']] = record.get('resolvedIps', [])
+            continue
+        records[key] = record
+
+    updated = []
+    if len(changed) > len(deleted):
+        results = aiter_config_query(aggregator_name, delta_queries(queries, since), page_size, max_workers=max_workers,
+                                     client=client, scheduler=scheduler)
+        updated = await fmt_output_async(results, resolver, known_ips)
+    for record in updated:
+        key = record_key(record)
+        if key not in deleted:
+            records[key] = record
+
+    output = list(records.values())
+    save_snapshot(snapshot_path, output, sync_start)
+    return output, {
+        'full': False,
+        'records': len(output),
+        'changed': len(changed) - len(deleted),
+        'deleted': len(deleted),
+        'knownHostnames': len(known_ips)
+    }
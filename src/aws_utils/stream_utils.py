@@ -0,0 +1,137 @@
+import gzip
+import json
+import os
+import zlib
+import aiofiles
+from aws_utils.ip_utils import json_loads
+
+try:
+    import orjson # optional fast JSON backend: pip install aws_utils[fast]
+
+    def json_dumps(record):
+        return orjson.dumps(record)
+except ImportError:
+    def json_dumps(record):
+        return json.dumps(record, ensure_ascii=False).encode('utf-8')
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class NDJSONWriter:
+    """
+    Async streaming writer for newline delimited JSON. Records are buffered and written
+    in chunks as they arrive, optionally gzip compressed (default for paths ending in .gz).
+    Records go to a temp file that replaces path only once the block exits cleanly, so a
+    failed run leaves the previous file in place.
+
+    Usage:
+        async with NDJSONWriter('public_ips.ndjson.gz') as writer:
+            async for record in aiter_fmt_output(results):
+                await writer.write(record)
+    """
+
+    def __init__(self, path, compress=None, chunk_size=1024 * 1024):
+        self.path = path
+        self.tmp_path = f'{path}.tmp'
+        self.compress = path.endswith('.gz') if compress is None else compress
+        self.chunk_size = chunk_size
+        self.count = 0
+        self._file = None
+        self._buffer = []
+        self._buffered = 0
+        self._compressor = None
+
+    async def __aenter__(self):
+        self._file = await aiofiles.open(self.tmp_path, 'wb')
+        if self.compress:
+            self._compressor = zlib.compressobj(wbits=31) # wbits=31 writes a gzip header
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        completed = False
+        try:
+            if exc_type is None:
+                await self.flush()
+                if self._compressor:
+                    await self._file.write(self._compressor.flush())
+                completed = True
+        finally:
+            await self._file.close()
+            if completed:
+                os.replace(self.tmp_path, self.path)
+            else:
+                os.remove(self.tmp_path)
+
+    async def write(self, record):
+        line = json_dumps(record) + b'\n'
+        self._buffer.append(line)
+        self._buffered += len(line)
+        self.count += 1
+        if self._buffered >= self.chunk_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        data = b''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        if self._compressor:
+            data = self._compressor.compress(data)
+        await self._file.write(data)
+
+async def write_ndjson(path, records, compress=None):
+    """
+    Streams records to a NDJSON file.
+
+    Args:
+        path: output file. Compressed with gzip if it ends in .gz and compress is not set
+        records: list or async iterable of JSON objects, e.g. aiter_fmt_output()
+        compress: force gzip on/off
+
+    Returns:
+        Number of records written
+    """
+    async with NDJSONWriter(path, compress) as writer:
+        if hasattr(records, '__aiter__'):
+            async for record in records:
+                await writer.write(record)
+        else:
+            for record in records:
+                await writer.write(record)
+    return writer.count
+
+def iter_ndjson(path):
+    """
+    Reads a file written by NDJSONWriter one record at a time.
+
+    Args:
+        path: NDJSON file, gzip compression is detected from the file's header
+
+    Yields:
+        JSON objects
+    """
+    opener = gzip.open if is_gzip(path) else open
+    with opener(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield json_loads(line)
+
+def is_gzip(path):
+    with open(path, 'rb') as f:
+        return f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+def search_file_for_ip(path, search_ip):
+    """
+    Streaming version of ip_utils.search_for_ip() over a saved NDJSON file.
+
+    Args:
+        path: NDJSON file written by NDJSONWriter
+        search_ip: string of IP to search for
+
+    Yields:
+        Matching resources
+    """
+    for d in iter_ndjson(path):
+        if search_ip == d.get('publicIp') or search_ip in (d.get('resolvedIps') or []):
+            yield d
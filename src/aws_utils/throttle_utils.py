@@ -0,0 +1,248 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# error codes AWS services use for rate limiting
+THROTTLE_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'LimitExceededException',
+    'SlowDown'
+}
+
+# starting requests/second per service. Cost Explorer and Organizations have low account limits
+DEFAULT_RATES = {
+    'ce': 5.0,
+    'config': 5.0,
+    'organizations': 5.0,
+    'eks': 10.0,
+    'sts': 10.0
+}
+
+
+def is_throttle(error):
+    from botocore.exceptions import ClientError # imported here so eks_utils can load without botocore
+
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLE_CODES
+
+class TokenBucket:
+    """
+    Thread safe token bucket. acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class ServiceLimiter:
+    """
+    Rate and concurrency limit for one AWS service. The rate is adaptive (AIMD): halved on a
+    throttle, at most once per round of requests (throttles of requests sent before the last
+    decrease are only counted), and raised while requests succeed by increase_ratio of the rate
+    (at least increase_step) per second, up to max_rate.
+    """
+
+    def __init__(self, rate, concurrency, min_rate=0.2, max_rate=None, increase_step=0.5, increase_ratio=0.1):
+        self.bucket = TokenBucket(rate)
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate * 2
+        self.increase_step = increase_step
+        self.increase_ratio = increase_ratio
+        self.calls = 0
+        self.throttles = 0
+        self.decreases = 0
+        self.retries = 0
+        self.errors = 0
+        self.in_flight = 0
+        self._last_decrease = float('-inf')
+        self._last_increase = time.monotonic()
+        self._lock = threading.Lock()
+
+    def on_success(self):
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            elapsed = now - self._last_increase
+            self._last_increase = now
+            rate = self.bucket.rate
+            rate = min(self.max_rate, rate + max(self.increase_step, rate * self.increase_ratio) * elapsed)
+        self.bucket.set_rate(rate)
+
+    def on_throttle(self, issued_at=None):
+        """
+        Args:
+            issued_at: time.monotonic() the throttled request was sent at. Requests sent before
+                the last decrease already went out at the old rate and do not lower it again
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.throttles += 1
+            if issued_at is not None and issued_at < self._last_decrease:
+                return
+            self.decreases += 1
+            self._last_decrease = self._last_increase = now
+            rate = max(self.min_rate, self.bucket.rate / 2)
+        self.bucket.set_rate(rate)
+
+    def stats(self):
+        return {
+            'rate': round(self.bucket.rate, 3),
+            'calls': self.calls,
+            'throttles': self.throttles,
+            'decreases': self.decreases,
+            'retries': self.retries,
+            'errors': self.errors,
+            'inFlight': self.in_flight
+        }
+
+class RequestScheduler:
+    """
+    Shared scheduler for AWS API calls across cost_utils, ip_utils and eks_utils.
+
+    call() runs a request through the service's token bucket and concurrency limit and
+    retries throttles with jittered exponential backoff. submit() runs work (e.g. a
+    whole get_costs() for one account) on the scheduler's thread pool. Clients used with a
+    scheduler should make single attempts (client_utils.get_client(..., scheduler=...)) so
+    every throttle reaches the backoff here instead of being retried inside botocore first.
+
+    Args:
+        max_workers: size of the thread pool used by submit()
+        rates: dict of service to starting requests/second, merged over DEFAULT_RATES
+        concurrency: dict of service to max in-flight requests (default max_workers)
+        max_retries: retries for a throttled request before the error is raised
+        base_delay: first backoff delay in seconds
+    """
+
+    def __init__(self, max_workers=10, rates=None, concurrency=None, max_retries=6, base_delay=0.5, max_delay=20.0):
+        self.max_workers = max_workers
+        self.rates = DEFAULT_RATES | (rates or {})
+        self.concurrency = concurrency or {}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.queue_depth = 0
+        self._limiters = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def limiter(self, service):
+        with self._lock:
+            limiter = self._limiters.get(service)
+            if limiter is None:
+                limiter = ServiceLimiter(self.rates.get(service, 5.0), self.concurrency.get(service, self.max_workers))
+                self._limiters[service] = limiter
+            return limiter
+
+    def call(self, service, func, *args, **kwargs):
+        """
+        Runs func(*args, **kwargs) in the calling thread once the service has capacity.
+        """
+        limiter = self.limiter(service)
+        attempt = 0
+        while True:
+            limiter.bucket.acquire()
+            with limiter.semaphore:
+                with limiter._lock:
+                    limiter.in_flight += 1
+                issued_at = time.monotonic()
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    if not is_throttle(e):
+                        with limiter._lock:
+                            limiter.errors += 1
+                        raise
+                    limiter.on_throttle(issued_at)
+                    if attempt >= self.max_retries:
+                        raise
+                else:
+                    limiter.on_success()
+                    return result
+                finally:
+                    with limiter._lock:
+                        limiter.in_flight -= 1
+            attempt += 1
+            with limiter._lock:
+                limiter.retries += 1
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+            time.sleep(random.uniform(delay / 2, delay)) # jitter so retries do not line up
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Runs func on the scheduler's thread pool. AWS calls inside func should use call().
+
+        Returns:
+            concurrent.futures.Future
+        """
+        with self._lock:
+            self.queue_depth += 1
+
+        def run():
+            with self._lock:
+                self.queue_depth -= 1
+            return func(*args, **kwargs)
+
+        return self._executor.submit(run)
+
+    def map(self, func, items):
+        """
+        submit() for each item, results returned in input order.
+        """
+        futures = [self.submit(func, item) for item in items]
+        return [future.result() for future in futures]
+
+    def stats(self):
+        with self._lock:
+            limiters = dict(self._limiters)
+            queue_depth = self.queue_depth
+        return {
+            'queueDepth': queue_depth,
+            'services': {service: limiter.stats() for service, limiter in limiters.items()}
+        }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+
+def scheduled_call(scheduler, service, func, *args, **kwargs):
+    """
+    Calls func through scheduler when one is set, directly otherwise.
+    """
+    if scheduler is None:
+        return func(*args, **kwargs)
+    return scheduler.call(service, func, *args, **kwargs)
@@ -0,0 +1,12 @@
+import pytest
+from aws_utils.cache_utils import CostCache
+from fakes import FakeCostExplorerClient
+
+
+@pytest.fixture
+def ce_client():
+    return FakeCostExplorerClient({'111111111111': 1.5, '222222222222': 0.25, '333333333333': 10.0})
+
+@pytest.fixture
+def cost_cache():
+    return CostCache(cache_dir=None)
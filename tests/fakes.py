@@ -0,0 +1,162 @@
+import json
+import re
+from aws_utils.cache_utils import split_period
+
+
+class FakeCostExplorerClient:
+    """
+    Stand in for the boto3 ce client. Answers get_cost_and_usage() from a fixed
+    {account_id: daily amount} table, one ResultsByTime entry per period in the
+    requested TimePeriod (a day per entry for HOURLY), page_size entries per page.
+    """
+
+    def __init__(self, daily_costs, page_size=2):
+        self.daily_costs = daily_costs
+        self.page_size = page_size
+        self.calls = [] # TimePeriod of every request, pages included
+
+    def get_cost_and_usage(self, TimePeriod, Granularity, Metrics, GroupBy, Filter=None, NextPageToken=None):
+        self.calls.append(dict(TimePeriod))
+        accounts = Filter['Dimensions']['Values'] if Filter else list(self.daily_costs)
+        periods = split_period(TimePeriod['Start'], TimePeriod['End'], Granularity)
+        start = int(NextPageToken or 0)
+        results = [self.result(period_start, period_end, accounts) for period_start, period_end in periods[start:start + self.page_size]]
+        response = {'ResultsByTime': results}
+        if start + self.page_size < len(periods):
+            response['NextPageToken'] = str(start + self.page_size)
+        return response
+
+    def result(self, start, end, accounts):
+        days = len(split_period(start, end, 'DAILY'))
+        return {
+            'TimePeriod': {'Start': start, 'End': end},
+            'Groups': [
+                {'Keys': [account_id], 'Metrics': {'UnblendedCost': {'Amount': str(self.daily_costs[account_id] * days), 'Unit': 'USD'}}}
+                for account_id in accounts if account_id in self.daily_costs
+            ]
+        }
+
+
+class FakeEKSClient:
+    """
+    Stand in for the boto3 eks client's access entry calls. Entries are a dict of
+    principal ARN -> {'kubernetesGroups': [...], 'policies': {policy ARN: accessScope}},
+    every write is recorded in writes.
+    """
+
+    def __init__(self, cluster_name='cluster', entries=None, page_size=2):
+        self.cluster_name = cluster_name
+        self.entries = entries or {}
+        self.page_size = page_size
+        self.calls = []
+        self.writes = []
+
+    def _page(self, items, result_key, nextToken=None):
+        start = int(nextToken or 0)
+        page = {result_key: items[start:start + self.page_size]}
+        if start + self.page_size < len(items):
+            page['nextToken'] = str(start + self.page_size)
+        return page
+
+    def describe_cluster(self, name):
+        self.calls.append('describe_cluster')
+        return {'cluster': {'name': name, 'endpoint': 'https://example.eks.amazonaws.com',
+                            'certificateAuthority': {'data': ''}}}
+
+    def list_access_entries(self, clusterName, nextToken=None):
+        self.calls.append('list_access_entries')
+        return self._page(sorted(self.entries), 'accessEntries', nextToken)
+
+    def describe_access_entry(self, clusterName, principalArn):
+        self.calls.append('describe_access_entry')
+        return {'accessEntry': {'principalArn': principalArn,
+                                'kubernetesGroups': list(self.entries[principalArn]['kubernetesGroups'])}}
+
+    def list_associated_access_policies(self, clusterName, principalArn, nextToken=None):
+        self.calls.append('list_associated_access_policies')
+        policies = [{'policyArn': policy_arn, 'accessScope': access_scope}
+                    for policy_arn, access_scope in sorted(self.entries[principalArn]['policies'].items())]
+        return self._page(policies, 'associatedAccessPolicies', nextToken)
+
+    def create_access_entry(self, clusterName, principalArn, kubernetesGroups=None):
+        self.writes.append(('create_access_entry', principalArn, kubernetesGroups))
+        self.entries[principalArn] = {'kubernetesGroups': list(kubernetesGroups or []), 'policies': {}}
+
+    def update_access_entry(self, clusterName, principalArn, kubernetesGroups=None):
+        self.writes.append(('update_access_entry', principalArn, kubernetesGroups))
+        self.entries[principalArn]['kubernetesGroups'] = list(kubernetesGroups or [])
+
+    def associate_access_policy(self, clusterName, principalArn, policyArn, accessScope):
+        self.writes.append(('associate_access_policy', principalArn, policyArn, accessScope))
+        self.entries[principalArn]['policies'][policyArn] = accessScope
+
+
+class FakeCredentialCache:
+    """
+    Stand in for eks_utils.CredentialCache handing out a FakeEKSClient, so an
+    EKSClusterManager can be built without AWS credentials.
+    """
+
+    def __init__(self, eks_client):
+        self.eks_client = eks_client
+
+    def session(self, role_arn, session_name, region):
+        return None
+
+    def client(self, role_arn, session_name, region, service, scheduler=None, request_timeout=None):
+        return self.eks_client if service == 'eks' else None
+
+
+
+class FakeConfigClient:
+    """
+    Stand in for the boto3 config client. Answers select_aggregate_resource_config() from a
+    list of configuration items, understanding just enough of the queries snapshot_utils and
+    the tests send: resourceType = / IN filters and the configurationItemCaptureTime filter.
+    Deleted items only match queries that select configurationItemStatus.
+    """
+
+    def __init__(self, items=None, page_size=2):
+        self.items = items or []
+        self.page_size = page_size
+        self.expressions = []
+
+    def select_aggregate_resource_config(self, Expression, ConfigurationAggregatorName, Limit=None, NextToken=None):
+        if not NextToken:
+            self.expressions.append(Expression)
+        types = set(re.findall(r"'(AWS::[\w:]+)'", Expression))
+        since = re.search(r"configurationItemCaptureTime > '([^']+)'", Expression)
+        changes_query = 'configurationItemStatus' in Expression
+        matches = [
+            item for item in self.items
+            if item['resourceType'] in types
+            and (since is None or item['configurationItemCaptureTime'] > since.group(1))
+            and (changes_query or item.get('configurationItemStatus') != 'ResourceDeleted')
+        ]
+        start = int(NextToken or 0)
+        limit = Limit or self.page_size
+        response = {'Results': [json.dumps(item) for item in matches[start:start + limit]]}
+        if start + limit < len(matches):
+            response['NextToken'] = str(start + limit)
+        return response
+
+
+class FakeDNSResolver:
+    """
+    Stand in for aiodns.DNSResolver answering from a hostname -> IPs dict. Every query
+    is recorded on the class so tests can see what a CachingResolver actually looked up.
+    """
+    queries = []
+    answers = {}
+
+    def __init__(self, nameservers=None):
+        pass
+
+    async def query(self, hostname, qtype):
+        FakeDNSResolver.queries.append(hostname)
+        return [_Answer(ip, 300) for ip in FakeDNSResolver.answers.get(hostname, [])]
+
+class _Answer:
+    def __init__(self, host, ttl):
+        self.host = host
+        self.ttl = ttl
@@ -0,0 +1,90 @@
+from datetime import date, datetime, timezone
+from aws_utils import cache_utils
+from aws_utils.cache_utils import CostCache, cache_key, is_closed, split_period
+
+
+def test_split_period_monthly_follows_calendar_months():
+    assert split_period('2024-01-15', '2024-03-02') == [
+        ('2024-01-15', '2024-02-01'),
+        ('2024-02-01', '2024-03-01'),
+        ('2024-03-01', '2024-03-02')
+    ]
+
+def test_split_period_monthly_across_year_end():
+    assert split_period('2023-12-01', '2024-02-01') == [('2023-12-01', '2024-01-01'), ('2024-01-01', '2024-02-01')]
+
+def test_split_period_daily():
+    assert split_period('2024-02-28', '2024-03-02', 'DAILY') == [
+        ('2024-02-28', '2024-02-29'),
+        ('2024-02-29', '2024-03-01'),
+        ('2024-03-01', '2024-03-02')
+    ]
+
+def test_split_period_hourly_uses_timestamps():
+    assert split_period('2024-01-31T00:00:00Z', '2024-02-02T00:00:00Z', 'HOURLY') == [
+        ('2024-01-31T00:00:00Z', '2024-02-01T00:00:00Z'),
+        ('2024-02-01T00:00:00Z', '2024-02-02T00:00:00Z')
+    ]
+
+def test_split_period_hourly_keeps_times_of_day():
+    assert split_period('2024-01-30T05:00:00Z', '2024-02-01T05:00:00Z', 'HOURLY') == [
+        ('2024-01-30T05:00:00Z', '2024-01-31T00:00:00Z'),
+        ('2024-01-31T00:00:00Z', '2024-02-01T00:00:00Z'),
+        ('2024-02-01T00:00:00Z', '2024-02-01T05:00:00Z')
+    ]
+
+def test_split_period_empty_range():
+    assert split_period('2024-01-01', '2024-01-01') == []
+
+def test_is_closed_monthly():
+    today = date(2024, 3, 15)
+    assert is_closed('2024-03-01', today=today)
+    assert not is_closed('2024-04-01', today=today)
+
+def test_is_closed_daily_and_hourly():
+    today = date(2024, 3, 15)
+    assert is_closed('2024-03-15', 'DAILY', today=today, settle_days=0)
+    assert not is_closed('2024-03-16', 'DAILY', today=today, settle_days=0)
+    assert is_closed('2024-03-15T00:00:00Z', 'HOURLY', today=today, settle_days=0)
+    assert not is_closed('2024-03-16T00:00:00Z', 'HOURLY', today=today, settle_days=0)
+
+def test_is_closed_hourly_period_ending_mid_day():
+    today = date(2024, 3, 15)
+    assert not is_closed('2024-03-15T05:00:00Z', 'HOURLY', today=today, settle_days=0)
+    assert is_closed('2024-03-14T05:00:00Z', 'HOURLY', today=today, settle_days=0)
+
+def test_is_closed_waits_for_recent_periods_to_settle():
+    assert not is_closed('2024-03-01', today=date(2024, 3, 2))
+    assert is_closed('2024-03-01', today=date(2024, 3, 3))
+    assert not is_closed('2024-03-14', 'DAILY', today=date(2024, 3, 15))
+    assert is_closed('2024-03-13', 'DAILY', today=date(2024, 3, 15))
+
+def test_is_closed_uses_the_utc_date(monkeypatch):
+    class FakeDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            # 01:00 on the 16th east of UTC is still the 15th in UTC
+            return datetime(2024, 3, 15, 23, 0, tzinfo=timezone.utc).astimezone(tz)
+
+    monkeypatch.setattr(cache_utils, 'datetime', FakeDatetime)
+    assert not is_closed('2024-03-16', 'DAILY', settle_days=0)
+    assert is_closed('2024-03-15', 'DAILY', settle_days=0)
+
+def test_cache_key_ignores_page_token_and_account_order():
+    params = {'TimePeriod': {'Start': '2024-01-01', 'End': '2024-02-01'},
+              'Filter': {'Dimensions': {'Key': 'LINKED_ACCOUNT', 'Values': ['2', '1']}}}
+    same = params | {'NextPageToken': 'abc', 'Filter': {'Dimensions': {'Key': 'LINKED_ACCOUNT', 'Values': ['1', '2']}}}
+    assert cache_key(params) == cache_key(same)
+
+def test_cost_cache_open_entries_expire(cost_cache):
+    params = {'TimePeriod': {'Start': '2024-01-01', 'End': '2024-02-01'}}
+    cost_cache.open_ttl = -1
+    cost_cache.put(params, [{'a': 1}], closed=False)
+    assert cost_cache.get(params) is None
+    cost_cache.put(params, [{'a': 1}], closed=True)
+    assert cost_cache.get(params) == [{'a': 1}]
+
+def test_cost_cache_reads_entries_back_from_disk(tmp_path):
+    params = {'TimePeriod': {'Start': '2024-01-01', 'End': '2024-02-01'}}
+    CostCache(cache_dir=str(tmp_path)).put(params, [{'a': 1}], closed=True)
+    assert CostCache(cache_dir=str(tmp_path)).get(params) == [{'a': 1}]
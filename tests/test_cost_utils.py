@@ -0,0 +1,88 @@
+import pytest
+from aws_utils.cost_utils import get_costs, get_costs_batched, get_costs_cached, get_total, split_costs_by_account
+from aws_utils.metrics_utils import STAGE_SECONDS, Metrics, disable_instrumentation, enable_instrumentation
+
+ACCOUNTS = ['111111111111', '222222222222', '333333333333']
+
+
+def starts(results):
+    return [r['TimePeriod']['Start'] for r in results]
+
+def test_get_costs_follows_page_tokens(ce_client):
+    results = get_costs(ce_client, '2024-01-01', '2024-06-01')
+    assert starts(results) == ['2024-01-01', '2024-02-01', '2024-03-01', '2024-04-01', '2024-05-01']
+    assert len(ce_client.calls) == 3
+
+def test_get_costs_cached_misses_fetch_the_whole_range_once(ce_client, cost_cache):
+    results = get_costs_cached(ce_client, '2024-01-01', '2024-04-01', cost_cache)
+    assert results == get_costs(ce_client, '2024-01-01', '2024-04-01')
+    assert ce_client.calls[0] == {'Start': '2024-01-01', 'End': '2024-04-01'}
+    calls = len(ce_client.calls)
+
+    assert get_costs_cached(ce_client, '2024-01-01', '2024-04-01', cost_cache) == results
+    assert len(ce_client.calls) == calls # every period served from the cache
+
+def test_get_costs_cached_fetches_each_run_of_missing_periods(ce_client, cost_cache):
+    get_costs_cached(ce_client, '2024-03-01', '2024-04-01', cost_cache)
+    ce_client.calls.clear()
+
+    results = get_costs_cached(ce_client, '2024-01-01', '2024-06-01', cost_cache, granularity='MONTHLY')
+    assert starts(results) == ['2024-01-01', '2024-02-01', '2024-03-01', '2024-04-01', '2024-05-01']
+    assert ce_client.calls == [
+        {'Start': '2024-01-01', 'End': '2024-03-01'},
+        {'Start': '2024-04-01', 'End': '2024-06-01'}
+    ]
+
+def test_get_costs_cached_partial_month_is_cached_separately(ce_client, cost_cache):
+    get_costs_cached(ce_client, '2024-01-15', '2024-02-01', cost_cache)
+    ce_client.calls.clear()
+    get_costs_cached(ce_client, '2024-01-01', '2024-02-01', cost_cache)
+    assert ce_client.calls == [{'Start': '2024-01-01', 'End': '2024-02-01'}]
+
+@pytest.mark.parametrize('granularity, fmt', [('DAILY', '{}'), ('HOURLY', '{}T00:00:00Z')])
+def test_get_costs_cached_daily_and_hourly(ce_client, cost_cache, granularity, fmt):
+    get_costs_cached(ce_client, fmt.format('2024-01-31'), fmt.format('2024-02-01'), cost_cache, granularity=granularity)
+    ce_client.calls.clear()
+
+    results = get_costs_cached(ce_client, fmt.format('2024-01-30'), fmt.format('2024-02-03'), cost_cache,
+                               granularity=granularity)
+    assert starts(results) == [fmt.format(day) for day in ('2024-01-30', '2024-01-31', '2024-02-01', '2024-02-02')]
+    assert ce_client.calls == [
+        {'Start': fmt.format('2024-01-30'), 'End': fmt.format('2024-01-31')},
+        {'Start': fmt.format('2024-02-01'), 'End': fmt.format('2024-02-03')}
+    ]
+
+def test_get_costs_cached_hourly_keeps_the_requested_window(ce_client, cost_cache):
+    start, end = '2024-01-30T05:00:00Z', '2024-01-31T05:00:00Z'
+    uncached = get_costs(ce_client, start, end, granularity='HOURLY')
+    assert get_costs(ce_client, start, end, granularity='HOURLY', cache=cost_cache) == uncached
+    assert get_costs(ce_client, start, end, granularity='HOURLY', cache=cost_cache) == uncached
+    assert starts(uncached) == ['2024-01-30T05:00:00Z', '2024-01-31T00:00:00Z']
+
+def test_split_costs_by_account_matches_per_account_queries(ce_client):
+    cost_data = get_costs(ce_client, '2024-01-01', '2024-04-01')
+    split = split_costs_by_account(cost_data, ACCOUNTS)
+    for account_id in ACCOUNTS:
+        single = get_costs(ce_client, '2024-01-01', '2024-04-01', account_id=account_id)
+        assert split[account_id] == single
+        assert get_total(split[account_id]) == pytest.approx(get_total(single))
+
+def test_split_costs_by_account_keeps_unknown_accounts_empty(ce_client):
+    split = split_costs_by_account(get_costs(ce_client, '2024-01-01', '2024-02-01'), ['999999999999'])
+    assert get_total(split['999999999999']) == 0.0
+    assert len(split['999999999999']) == 1
+
+@pytest.mark.parametrize('chunk_size', [None, 2])
+def test_get_costs_batched_totals(ce_client, cost_cache, chunk_size):
+    batched = get_costs_batched(ce_client, '2024-01-01', '2024-03-01', ACCOUNTS, chunk_size=chunk_size, cache=cost_cache)
+    for account_id in ACCOUNTS:
+        single = get_costs(ce_client, '2024-01-01', '2024-03-01', account_id=account_id)
+        assert get_total(batched[account_id]) == pytest.approx(get_total(single))
+
+def test_cached_get_costs_is_timed_once(ce_client, cost_cache):
+    metrics = enable_instrumentation(Metrics())
+    try:
+        get_costs(ce_client, '2024-01-01', '2024-04-01', cache=cost_cache)
+    finally:
+        disable_instrumentation()
+    assert [s['count'] for s in metrics.summary()[STAGE_SECONDS] if s['labels'] == {'stage': 'get_costs'}] == [1]
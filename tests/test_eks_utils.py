@@ -0,0 +1,113 @@
+import pytest
+from aws_utils.eks_utils import (ADMIN_POLICY_ARN, CLUSTER_ADMIN_POLICY_ARN, CLUSTER_SCOPE, EKSClusterManager,
+                                 reconcile_access_entries)
+from fakes import FakeCredentialCache, FakeEKSClient
+
+ROLE = 'arn:aws:iam::111111111111:role/eks-manager'
+DEV = 'arn:aws:iam::111111111111:role/dev'
+OPS = 'arn:aws:iam::111111111111:role/ops'
+VIEW_POLICY = 'arn:aws:eks::aws:cluster-access-policy/AmazonEKSViewPolicy'
+EDIT_POLICY = 'arn:aws:eks::aws:cluster-access-policy/AmazonEKSEditPolicy'
+
+
+def make_manager(entries=None, cluster_name='cluster'):
+    eks_client = FakeEKSClient(cluster_name, entries)
+    manager = EKSClusterManager(cluster_name, 'us-east-1', ROLE, credential_cache=FakeCredentialCache(eks_client))
+    eks_client.calls.clear()
+    return manager, eks_client
+
+def entry(groups=(), policies=None):
+    return {'kubernetesGroups': list(groups), 'policies': dict(policies or {})}
+
+def test_update_access_entry_creates_missing_admin_entry():
+    manager, eks_client = make_manager()
+    assert manager.update_access_entry() == 200
+    assert eks_client.writes == [
+        ('create_access_entry', ROLE, ['masters']),
+        ('associate_access_policy', ROLE, ADMIN_POLICY_ARN, CLUSTER_SCOPE)
+    ]
+    assert manager.update_access_entry() == 304
+    assert len(eks_client.writes) == 2
+
+@pytest.mark.parametrize('policy_arn', [ADMIN_POLICY_ARN, CLUSTER_ADMIN_POLICY_ARN])
+def test_update_access_entry_leaves_existing_admin_entry_alone(policy_arn):
+    manager, eks_client = make_manager({ROLE: entry(['ops'], {policy_arn: {'type': 'cluster', 'namespaces': []}})})
+    assert manager.update_access_entry() == 304
+    assert eks_client.writes == []
+    assert 'describe_access_entry' not in eks_client.calls
+    assert eks_client.entries[ROLE]['kubernetesGroups'] == ['ops']
+
+def test_update_access_entry_adds_admin_policy_to_existing_entry_without_it():
+    manager, eks_client = make_manager({ROLE: entry(['ops'], {VIEW_POLICY: CLUSTER_SCOPE})})
+    assert manager.update_access_entry() == 200
+    assert eks_client.writes == [('associate_access_policy', ROLE, ADMIN_POLICY_ARN, CLUSTER_SCOPE)]
+
+def test_access_entry_changes_diffs_groups_and_scopes():
+    manager, eks_client = make_manager({
+        DEV: entry(['devs', 'other'], {VIEW_POLICY: {'type': 'namespace', 'namespaces': ['b', 'a']}}),
+        OPS: entry([], {VIEW_POLICY: CLUSTER_SCOPE})
+    })
+    changes = manager.access_entry_changes({
+        DEV: {'kubernetes_groups': ['devs'], 'policies': {VIEW_POLICY: {'type': 'namespace', 'namespaces': ['a', 'b']}}},
+        OPS: {'kubernetes_groups': None, 'policies': {VIEW_POLICY: {'type': 'namespace', 'namespaces': ['ops']}}},
+        ROLE: {'kubernetes_groups': ['admins'], 'policies': {EDIT_POLICY: None}}
+    })
+    assert changes == [
+        (OPS, False, None, [(VIEW_POLICY, {'type': 'namespace', 'namespaces': ['ops']})]),
+        (ROLE, True, ['admins'], [(EDIT_POLICY, CLUSTER_SCOPE)])
+    ]
+    assert eks_client.writes == []
+
+def test_access_entry_changes_only_adds_groups():
+    manager, _ = make_manager({DEV: entry(['other'])})
+    assert manager.access_entry_changes({DEV: {'kubernetes_groups': ['devs'], 'policies': {}}}) == [
+        (DEV, False, ['devs', 'other'], [])
+    ]
+
+def test_reconcile_access_entries_applies_then_is_idempotent():
+    first, first_client = make_manager({DEV: entry([], {VIEW_POLICY: CLUSTER_SCOPE})}, 'first')
+    second, second_client = make_manager(cluster_name='second')
+    managers = {'first': first, 'second': second}
+    desired = [
+        ('first', DEV, VIEW_POLICY),
+        ('first', DEV, EDIT_POLICY, {'type': 'namespace', 'namespaces': ['dev']}),
+        ('second', DEV, VIEW_POLICY, None, ['devs']),
+        ('second', OPS, EDIT_POLICY)
+    ]
+
+    planned = reconcile_access_entries(managers, desired, dry_run=True)
+    assert [(c['cluster_name'], c['principal_arn'], c['status']) for c in planned] == [
+        ('first', DEV, 'planned'), ('second', DEV, 'planned'), ('second', OPS, 'planned')
+    ]
+    assert first_client.writes == second_client.writes == []
+
+    applied = reconcile_access_entries(managers, desired)
+    assert [c['status'] for c in applied] == ['applied'] * 3
+    assert first_client.writes == [
+        ('associate_access_policy', DEV, EDIT_POLICY, {'type': 'namespace', 'namespaces': ['dev']})
+    ]
+    assert sorted(second_client.writes) == [
+        ('associate_access_policy', DEV, VIEW_POLICY, CLUSTER_SCOPE),
+        ('associate_access_policy', OPS, EDIT_POLICY, CLUSTER_SCOPE),
+        ('create_access_entry', DEV, ['devs']),
+        ('create_access_entry', OPS, None)
+    ]
+
+    first_client.writes.clear()
+    second_client.writes.clear()
+    assert reconcile_access_entries(managers, desired) == []
+    assert first_client.writes == second_client.writes == []
+
+def test_reconcile_access_entries_reports_cluster_errors():
+    manager, eks_client = make_manager()
+
+    def fail(**kwargs):
+        raise RuntimeError('AccessDenied')
+
+    eks_client.list_access_entries = fail
+    changes = reconcile_access_entries({'cluster': manager}, [('cluster', DEV, VIEW_POLICY)])
+    assert [(c['cluster_name'], c['status'], c['error']) for c in changes] == [('cluster', 'error', 'AccessDenied')]
+
+def test_reconcile_access_entries_rejects_unknown_clusters():
+    with pytest.raises(ValueError):
+        reconcile_access_entries({}, [('missing', DEV, VIEW_POLICY)])
@@ -0,0 +1,47 @@
+from aws_utils.ip_utils import IPIndex
+
+RECORDS = [
+    {'resourceId': 'eni-1', 'publicIp': '52.10.0.5', 'resolvedIps': ['52.10.0.5']},
+    {'resourceId': 'elb-1', 'resolvedIps': ['52.10.1.7', '52.10.2.9']},
+    {'resourceId': 'elb-2', 'resolvedIps': ['52.10.1.7']},
+    {'resourceId': 'eip-1', 'publicIp': '3.5.0.1'},
+    {'resourceId': 'rds-1', 'resolvedIps': ['2600:1f18::1', 'not-an-ip']},
+    {'resourceId': 'empty'}
+]
+
+
+def ids(records):
+    return [r['resourceId'] for r in records]
+
+def test_lookup_lists_a_record_once_when_public_and_resolved_ips_match():
+    assert ids(IPIndex(RECORDS).lookup('52.10.0.5')) == ['eni-1']
+
+def test_lookup_returns_every_record_sharing_an_ip():
+    assert ids(IPIndex(RECORDS).lookup('52.10.1.7')) == ['elb-1', 'elb-2']
+
+def test_lookup_misses_and_invalid_ips():
+    index = IPIndex(RECORDS)
+    assert index.lookup('8.8.8.8') == []
+    assert index.lookup('not-an-ip') == []
+
+def test_lookup_many_leaves_out_misses():
+    assert {ip: ids(records) for ip, records in IPIndex(RECORDS).lookup_many(['3.5.0.1', '8.8.8.8']).items()} == {
+        '3.5.0.1': ['eip-1']
+    }
+
+def test_index_skips_invalid_ips():
+    assert len(IPIndex(RECORDS)) == 5
+
+def test_in_network_dedupes_records_with_several_ips_inside():
+    assert sorted(ids(IPIndex(RECORDS).in_network('52.10.0.0/16'))) == ['elb-1', 'elb-2', 'eni-1']
+
+def test_in_network_bounds_are_inclusive():
+    index = IPIndex(RECORDS)
+    assert ids(index.in_network('52.10.0.5/32')) == ['eni-1']
+    assert ids(index.in_network('52.10.2.0/24')) == ['elb-1']
+    assert index.in_network('52.11.0.0/16') == []
+
+def test_in_network_does_not_mix_ip_versions():
+    index = IPIndex(RECORDS)
+    assert ids(index.in_network('2600:1f18::/32')) == ['rds-1']
+    assert 'rds-1' not in ids(index.in_network('0.0.0.0/0'))
@@ -0,0 +1,108 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from aws_utils.dns_utils import CachingResolver
+from aws_utils.snapshot_utils import fmt_capture_time, load_snapshot, refresh_inventory
+from fakes import FakeConfigClient, FakeDNSResolver
+
+QUERIES = {
+    'ENI': "SELECT * WHERE resourceType = 'AWS::EC2::NetworkInterface'",
+    'RDS': "SELECT * WHERE resourceType = 'AWS::RDS::DBInstance'"
+}
+
+
+def captured(minutes_ago):
+    return fmt_capture_time(datetime.now(timezone.utc) - timedelta(minutes=minutes_ago))
+
+def eni(resource_id, public_ip, minutes_ago=120, status='OK'):
+    return {'accountId': '111111111111', 'awsRegion': 'us-east-1', 'resourceType': 'AWS::EC2::NetworkInterface',
+            'resourceId': resource_id, 'configurationItemCaptureTime': captured(minutes_ago),
+            'configurationItemStatus': status, 'configuration': {'association': {'publicIp': public_ip}}}
+
+def rds(resource_id, address, minutes_ago=120, status='OK'):
+    return {'accountId': '111111111111', 'awsRegion': 'us-east-1', 'resourceType': 'AWS::RDS::DBInstance',
+            'resourceId': resource_id, 'configurationItemCaptureTime': captured(minutes_ago),
+            'configurationItemStatus': status, 'configuration': {'endpoint': {'address': address}}}
+
+def refresh(client, snapshot_path):
+    FakeDNSResolver.queries = []
+    resolver = CachingResolver(resolver_factory=FakeDNSResolver)
+    return asyncio.run(refresh_inventory('aggregator', QUERIES, str(snapshot_path), client=client, resolver=resolver))
+
+def by_id(records):
+    return {r['resourceId']: r for r in records}
+
+def backdate_snapshot(snapshot_path, minutes):
+    # pretend the last sync ran minutes ago so items captured since then count as changed
+    with open(snapshot_path, 'r', encoding='utf-8') as f:
+        snapshot = json.load(f)
+    snapshot['lastSync'] = captured(minutes)
+    with open(snapshot_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+
+def test_first_run_is_a_full_query(tmp_path, monkeypatch):
+    monkeypatch.setattr(FakeDNSResolver, 'answers', {'db-1.rds.amazonaws.com': ['10.0.0.1']})
+    client = FakeConfigClient([eni('eni-1', '52.0.0.1'), rds('db-1', 'db-1.rds.amazonaws.com')])
+    records, stats = refresh(client, tmp_path / 'snapshot.json')
+
+    assert stats == {'full': True, 'records': 2}
+    assert by_id(records)['db-1']['resolvedIps'] == ['10.0.0.1']
+    assert FakeDNSResolver.queries == ['db-1.rds.amazonaws.com']
+    assert len(load_snapshot(tmp_path / 'snapshot.json')['records']) == 2
+
+def test_delta_run_upserts_changed_and_drops_deleted(tmp_path, monkeypatch):
+    monkeypatch.setattr(FakeDNSResolver, 'answers', {'db-1.rds.amazonaws.com': ['10.0.0.1'],
+                                                     'db-3.rds.amazonaws.com': ['10.0.0.3']})
+    snapshot_path = tmp_path / 'snapshot.json'
+    client = FakeConfigClient([eni('eni-1', '52.0.0.1'), eni('eni-2', '52.0.0.2'),
+                               rds('db-1', 'db-1.rds.amazonaws.com'), rds('db-2', 'db-2.rds.amazonaws.com')])
+    refresh(client, snapshot_path)
+    backdate_snapshot(snapshot_path, 60)
+
+    client.items = [
+        eni('eni-1', '52.0.0.10', minutes_ago=5), # new public IP
+        eni('eni-2', None, minutes_ago=5, status='ResourceDeleted'),
+        rds('db-1', 'db-1.rds.amazonaws.com', minutes_ago=5), # changed, same hostname
+        rds('db-2', 'db-2.rds.amazonaws.com'), # unchanged
+        rds('db-3', 'db-3.rds.amazonaws.com', minutes_ago=5, status='ResourceDiscovered')
+    ]
+    client.expressions.clear()
+    records, stats = refresh(client, snapshot_path)
+
+    assert stats == {'full': False, 'records': 4, 'changed': 3, 'deleted': 1, 'knownHostnames': 1}
+    records = by_id(records)
+    assert sorted(records) == ['db-1', 'db-2', 'db-3', 'eni-1']
+    assert records['eni-1']['publicIp'] == '52.0.0.10'
+    assert records['db-1']['resolvedIps'] == ['10.0.0.1']
+    assert FakeDNSResolver.queries == ['db-3.rds.amazonaws.com'] # db-1 reused its last lookup
+    assert by_id(load_snapshot(snapshot_path)['records']).keys() == records.keys()
+
+def test_delta_run_with_only_deletions_skips_the_delta_queries(tmp_path):
+    snapshot_path = tmp_path / 'snapshot.json'
+    client = FakeConfigClient([eni('eni-1', '52.0.0.1'), eni('eni-2', '52.0.0.2')])
+    refresh(client, snapshot_path)
+    backdate_snapshot(snapshot_path, 60)
+
+    client.items = [eni('eni-1', '52.0.0.1'), eni('eni-2', None, minutes_ago=5, status='ResourceDeleted')]
+    client.expressions.clear()
+    records, stats = refresh(client, snapshot_path)
+
+    assert [r['resourceId'] for r in records] == ['eni-1']
+    assert stats['deleted'] == 1
+    assert len(client.expressions) == 1 # only the changed items query
+
+def test_delta_window_overlaps_the_last_sync(tmp_path):
+    snapshot_path = tmp_path / 'snapshot.json'
+    client = FakeConfigClient([eni('eni-1', '52.0.0.1')])
+    refresh(client, snapshot_path)
+    backdate_snapshot(snapshot_path, 60)
+    last_sync = load_snapshot(snapshot_path)['lastSync']
+
+    # delivered late: captured 10 minutes before the last sync but not in it
+    client.items.append(eni('eni-2', '52.0.0.2', minutes_ago=70))
+    client.expressions.clear()
+    records, _ = refresh(client, snapshot_path)
+
+    since = datetime.strptime(last_sync, '%Y-%m-%dT%H:%M:%S.000Z') - timedelta(minutes=15)
+    assert f"configurationItemCaptureTime > '{since.strftime('%Y-%m-%dT%H:%M:%S.000Z')}'" in client.expressions[0]
+    assert sorted(by_id(records)) == ['eni-1', 'eni-2']
@@ -0,0 +1,33 @@
+import asyncio
+import pytest
+from aws_utils.stream_utils import iter_ndjson, search_file_for_ip, write_ndjson
+
+RECORDS = [
+    {'resourceId': 'eni-1', 'publicIp': '52.0.0.1'},
+    {'resourceId': 'db-1', 'resolvedIps': ['10.0.0.1', '52.0.0.2']}
+]
+
+
+async def failing_records():
+    yield RECORDS[0]
+    raise RuntimeError('config query failed')
+
+@pytest.mark.parametrize('name, compress', [
+    ('ips.ndjson', None),
+    ('ips.ndjson.gz', None),
+    ('ips.ndjson', True), # gzip without the suffix
+    ('ips.ndjson.gz', False)
+])
+def test_round_trip(tmp_path, name, compress):
+    path = str(tmp_path / name)
+    assert asyncio.run(write_ndjson(path, RECORDS, compress=compress)) == 2
+    assert list(iter_ndjson(path)) == RECORDS
+    assert [r['resourceId'] for r in search_file_for_ip(path, '52.0.0.2')] == ['db-1']
+
+def test_failed_stream_keeps_the_previous_file(tmp_path):
+    path = str(tmp_path / 'ips.ndjson')
+    asyncio.run(write_ndjson(path, RECORDS))
+    with pytest.raises(RuntimeError):
+        asyncio.run(write_ndjson(path, failing_records()))
+    assert list(iter_ndjson(path)) == RECORDS
+    assert [p.name for p in tmp_path.iterdir()] == ['ips.ndjson']
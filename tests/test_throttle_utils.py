@@ -0,0 +1,119 @@
+import pytest
+from botocore.exceptions import ClientError
+from aws_utils import throttle_utils
+from aws_utils.client_utils import SCHEDULED_RETRIES, ClientPool, retries_for
+from aws_utils.throttle_utils import RequestScheduler, ServiceLimiter, scheduled_call
+
+
+def throttle():
+    return ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, 'GetCostAndUsage')
+
+class FlakyCall:
+    """
+    Raises the given errors in order, then returns 'ok'.
+    """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.attempts = 0
+
+    def __call__(self):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def scheduler():
+    with RequestScheduler(max_workers=4, rates={'ce': 1000.0}, base_delay=0.001, max_delay=0.002) as scheduler:
+        yield scheduler
+
+def test_throttles_are_retried_and_counted(scheduler):
+    func = FlakyCall(throttle(), throttle())
+    assert scheduler.call('ce', func) == 'ok'
+    stats = scheduler.stats()['services']['ce']
+    assert func.attempts == 3
+    assert (stats['calls'], stats['throttles'], stats['retries'], stats['errors']) == (1, 2, 2, 0)
+
+def test_throttle_is_raised_after_max_retries(scheduler):
+    scheduler.max_retries = 2
+    func = FlakyCall(*[throttle() for _ in range(5)])
+    with pytest.raises(ClientError):
+        scheduler.call('ce', func)
+    stats = scheduler.stats()['services']['ce']
+    assert func.attempts == 3
+    assert (stats['calls'], stats['throttles'], stats['retries']) == (0, 3, 2)
+
+def test_other_errors_are_not_retried(scheduler):
+    func = FlakyCall(ValueError('bad request'))
+    with pytest.raises(ValueError):
+        scheduler.call('ce', func)
+    stats = scheduler.stats()['services']['ce']
+    assert func.attempts == 1
+    assert (stats['errors'], stats['retries'], stats['throttles']) == (1, 0, 0)
+
+def test_scheduled_call_without_scheduler_calls_directly():
+    assert scheduled_call(None, 'ce', FlakyCall()) == 'ok'
+
+def test_concurrent_throttles_lower_the_rate_once(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(throttle_utils, 'time', clock)
+    limiter = ServiceLimiter(rate=8.0, concurrency=4)
+    issued_at = clock.monotonic()
+    clock.sleep(0.1)
+    for _ in range(4): # one burst of requests sent at the same rate
+        limiter.on_throttle(issued_at)
+    assert limiter.bucket.rate == 4.0
+    assert (limiter.throttles, limiter.decreases) == (4, 1)
+
+    clock.sleep(0.1)
+    limiter.on_throttle(clock.monotonic()) # sent after the decrease and still throttled
+    assert limiter.bucket.rate == 2.0
+    assert limiter.decreases == 2
+
+def test_rate_never_drops_below_min_rate(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(throttle_utils, 'time', clock)
+    limiter = ServiceLimiter(rate=1.0, concurrency=1, min_rate=0.2)
+    for _ in range(10):
+        clock.sleep(1)
+        limiter.on_throttle(clock.monotonic())
+    assert limiter.bucket.rate == 0.2
+
+def test_rate_recovers_with_time_not_call_count(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(throttle_utils, 'time', clock)
+    limiter = ServiceLimiter(rate=20.0, concurrency=4, max_rate=40.0, increase_step=0.5, increase_ratio=0.1)
+    limiter.on_throttle(clock.monotonic())
+    assert limiter.bucket.rate == 10.0
+
+    for _ in range(100): # successes at the same instant do not add up
+        limiter.on_success()
+    assert limiter.bucket.rate == 10.0
+
+    clock.sleep(2)
+    limiter.on_success()
+    assert limiter.bucket.rate == pytest.approx(12.0) # 10% of the rate per second
+
+    clock.sleep(60)
+    limiter.on_success()
+    assert limiter.bucket.rate == 40.0 # capped at max_rate
+
+def test_scheduled_clients_make_single_attempts():
+    assert retries_for(None) is None
+    assert retries_for(object()) == SCHEDULED_RETRIES
+    pool = ClientPool()
+    scheduled = pool.client('ce', 'us-east-1', retries=SCHEDULED_RETRIES)
+    assert scheduled is not pool.client('ce', 'us-east-1')
+    assert scheduled.meta.config.retries['total_max_attempts'] == 1
+    assert SCHEDULED_RETRIES == {'total_max_attempts': 1}